@@ -2,39 +2,54 @@ import sys
 import atexit
 from apscheduler.schedulers.background import BackgroundScheduler
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_httpauth import HTTPBasicAuth
 from config import Config, devconfig
+from app.session import RoutingSQLAlchemy
 
 app = Flask(__name__)
 app.config.from_object(Config)
 if "-d" in sys.argv:
     app.config.from_object(devconfig)
 
-if app.config["ENV"] == "development":
-    db = SQLAlchemy(app, session_options={"autoflush": True})
-else:
-    db = SQLAlchemy(app, session_options={"autoflush": True},
-                    engine_options={"executemany_mode": "batch"})
+
+def engine_options(config):
+    """Engine options of the configured database"""
+    uri = config["SQLALCHEMY_DATABASE_URI"]
+    # SQLite files use a NullPool, pooling options don't apply
+    if uri.startswith("sqlite"):
+        return {}
+    options = {"pool_size": config["DB_POOL_SIZE"],
+               "max_overflow": config["DB_MAX_OVERFLOW"],
+               "pool_recycle": config["DB_POOL_RECYCLE"],
+               "pool_pre_ping": config["DB_POOL_PRE_PING"]}
+    if uri.startswith("postgres"):
+        # DB_STATEMENT_TIMEOUT is set per checkout, see storage.py
+        options["executemany_mode"] = "batch"
+    return options
+
+
+# Reads of GET requests are routed to DATABASE_REPLICAS if configured
+db = RoutingSQLAlchemy(app, session_options={"autoflush": True},
+                       engine_options=engine_options(app.config))
 auth = HTTPBasicAuth()
 
 cron = BackgroundScheduler(daemon=True)
-# Explicitly kick off the background thread
-cron.start()
-app.maintenance = False
-
-import app.utils as utils
-from app.utils.maintenance import maintenance
-cron.add_job(maintenance, "date", run_date=utils.tomorrow())
-
-
-# Shutdown your cron thread if the web process is stopped
-atexit.register(lambda: cron.shutdown(wait=False))
 
 
 from app.routes import *
 from app.models import *
+import app.cli as cli
+# Listeners of new connections (SQLite pragmas, metrics of replicas),
+# before create_all creates the file
+from app.utils import storage, replicas
 db.create_all()
 
+# Every web process runs the scheduler, only the elected leader runs
+# maintenance, flask CLI commands don't
+from app.utils.scheduler import start_scheduler
+start_scheduler()
+# Shutdown your cron thread if the web process is stopped
+atexit.register(lambda: cron.running and cron.shutdown(wait=False))
+
 with open("banner.txt") as f:
     print(f.read())
@@ -0,0 +1,102 @@
+import click
+from app import app
+
+
+@app.cli.command("backfill-results")
+@click.option("--batch-size", default=1000, help="Games per transaction")
+def backfill_results(batch_size):
+    """Fills game_results from the result column of all games"""
+    from app.utils.results import backfill_game_results
+    click.echo(f"{backfill_game_results(batch_size)} rows written")
+
+
+@app.cli.command("backfill-end-date")
+@click.option("--all", "all", is_flag=True, help="Recompute the end_date "
+              "of all tournaments, not only of those without one")
+def backfill_end_date(all):
+    """Adds and fills tournaments.end_date of databases created before it"""
+    from app.utils.end_dates import backfill_end_dates
+    click.echo(f"end_date of {backfill_end_dates(all)} tournaments written")
+
+
+@app.cli.command("replay-ratings")
+@click.argument("model", default="current")
+@click.option("--write", type=click.Choice(["alt", "points", "none"]),
+              default="alt", help="alt_ratings side table, User.points or "
+              "nothing")
+@click.option("--param", "-p", multiple=True,
+              help="Model parameter as name=value, e.g. -p k=24")
+def replay_ratings(model, write, param):
+    """Replays all finished games with a rating model"""
+    from app.utils.replay import (replay, write_alt_ratings,
+                                  backfill_points)
+    params = {name: float(value) if "." in value else int(value)
+              for name, value in (item.split("=", 1) for item in param)}
+    history, ratings = replay(model, **params)
+    click.echo(f"Replayed {len(history.games)} games of "
+               f"{len(history.user_ids)} users with {model}")
+    if write == "alt":
+        click.echo(f"{write_alt_ratings(model, history, ratings)} "
+                   "alt_ratings rows written")
+    elif write == "points":
+        if model != "current" and app.config["RATING_CONSISTENCY_CHECK"]:
+            click.echo("Warning: the nightly consistency check resets points "
+                       "to the current formula", err=True)
+        click.echo(f"Points of {backfill_points(history, ratings)} users "
+                   "written")
+
+
+@app.cli.command("export")
+@click.argument("table")
+@click.option("--format", "format", type=click.Choice(["ndjson", "csv"]),
+              default="ndjson")
+@click.option("--output", "-o", type=click.File("w"), default="-")
+def export_data(table, format, output):
+    """Streams a table or 'all' tables (NDJSON only) to a file"""
+    from app.utils.transfer import export_table, export_all
+    if table == "all" and format != "ndjson":
+        raise click.UsageError("'all' can only be exported as NDJSON")
+    for chunk in export_all() if table == "all" else \
+            export_table(table, format):
+        output.write(chunk)
+
+
+@app.cli.command("import")
+@click.argument("table")
+@click.argument("input", type=click.File("r"), default="-")
+@click.option("--format", "format", type=click.Choice(["ndjson", "csv"]),
+              default="ndjson")
+@click.option("--chunk-size", default=5000, help="Rows per transaction")
+def import_data(table, input, format, chunk_size):
+    """Imports an export of a table or of 'all' tables (NDJSON only)"""
+    from app.models import Games
+    from app.utils.transfer import (read_records, import_records,
+                                    repair_ratings, PartialImport)
+    if table == "all" and format != "ndjson":
+        raise click.UsageError("'all' can only be imported from NDJSON")
+    error = None
+    try:
+        counts = import_records(read_records(
+            input, format, None if table == "all" else table), chunk_size)
+    except PartialImport as e:
+        counts, error = e.counts, e
+    for name, count in counts.items():
+        click.echo(f"{name}: {count} rows imported")
+    if Games.__tablename__ in counts:
+        click.echo(f"Ratings of {len(repair_ratings())} users repaired")
+    if error is not None:
+        raise click.ClickException(f"Import failed: {error}, the rows "
+                                   "above stay imported")
+
+
+@app.cli.command("vacuum")
+@click.option("--full", is_flag=True, help="Rewrite the SQLite file, needed "
+              "once to switch an existing database to auto_vacuum")
+def vacuum_data(full):
+    """Runs the storage maintenance of the nightly maintenance"""
+    from app.utils.storage import vacuum
+    report = vacuum(full)
+    click.echo(f"{report['database']}: {report['size_before']} -> "
+               f"{report['size_after']} bytes in {report['duration']}s")
+    for table, duration in report.get("tables", {}).items():
+        click.echo(f"{table}: {duration}s")
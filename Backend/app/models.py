@@ -2,12 +2,67 @@ import json
 import logging
 import warnings
 from app import app, db
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.expression import UpdateBase
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import (TimedJSONWebSignatureSerializer
                           as Serializer, BadSignature, SignatureExpired)
 
 
+@lru_cache(maxsize=16)
+def get_serializer(secret_key, expiration=None):
+    """Serializers are reused, building them derives keys every time"""
+    return Serializer(secret_key, expires_in=expiration)
+
+
+def insert_returning_ids(table, rows):
+    """
+    Inserts rows (dicts with the same keys) with multi row INSERTs and
+    returns their primary keys in order
+    """
+    dialect = db.session.get_bind().dialect.name
+    if not rows:
+        return []
+    if dialect == "postgresql":
+        return [id for id, in db.session.execute(
+            table.insert().values(rows).returning(table.c.id))]
+    if dialect != "sqlite":
+        return [db.session.execute(table.insert(), row
+                                   ).inserted_primary_key[0] for row in rows]
+    ids = []
+    # Older SQLite versions allow at most 999 parameters per statement
+    size = max(999 // len(rows[0]), 1)
+    for start in range(0, len(rows), size):
+        chunk = rows[start:start + size]
+        db.session.execute(table.insert().values(chunk))
+        # A multi row INSERT gets consecutive rowids, SQLite has one writer
+        last = db.session.execute("SELECT last_insert_rowid()").scalar()
+        ids.extend(range(last - len(chunk) + 1, last + 1))
+    return ids
+
+
+def insert_ignore(table, rows, connection=None):
+    """
+    Inserts rows, rows conflicting with existing ones (e.g. inserted by a
+    concurrent transaction) are skipped
+    """
+    connection = connection or db.session
+    dialect = getattr(connection, "dialect", None) or \
+        connection.get_bind().dialect
+    if not rows:
+        return
+    if dialect.name == "postgresql":
+        statement = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect.name == "sqlite":
+        statement = table.insert().prefix_with("OR IGNORE")
+    else:
+        statement = table.insert().prefix_with("IGNORE")
+    connection.execute(statement, rows)
+
+
 class User(db.Model):
     __tablename__ = "user"
 
@@ -20,9 +75,9 @@ class User(db.Model):
         return check_password_hash(self.password, password)
 
     def generate_auth_token(self, expiration=600):
-        s = Serializer(app.config["SECRET_KEY"], expires_in=expiration)
-        refresh_token = Serializer(app.config["SECRET_KEY"],
-                                   expires_in=expiration*36)
+        s = get_serializer(app.config["SECRET_KEY"], expiration)
+        refresh_token = get_serializer(app.config["SECRET_KEY"],
+                                       expiration*36)
         return refresh_token.dumps({"id": self.id}), s.dumps({"id": self.id})
 
     def add_role(self, role):
@@ -31,19 +86,26 @@ class User(db.Model):
         return
 
     @staticmethod
-    def verify_auth_token(token):
-        s = Serializer(app.config["SECRET_KEY"])
+    def load_auth_token(token):
+        """Returns (data, header) of a valid token or (None, None)"""
+        s = get_serializer(app.config["SECRET_KEY"])
         try:
-            data = s.loads(token)
+            return s.loads(token, return_header=True)
         except SignatureExpired:
-            return False  # valid token, but expired
+            return None, None  # valid token, but expired
         except BadSignature:
-            return False  # invalid token
+            return None, None  # invalid token
+
+    @staticmethod
+    def verify_auth_token(token):
+        data, _ = User.load_auth_token(token)
+        if data is None:
+            return False
         user = User.query.get(data["id"])
         return user
 
     def jsonify(self, full=False, points=False):
-        """Returns json object with user data"""
+        """Returns dict with user data"""
         if full:
             user = dict(
                         id=self.id, username=self.username,
@@ -55,25 +117,31 @@ class User(db.Model):
             user = dict(id=self.id, username=self.username)
         if points:
             user["points"] = self.points
-        return json.dumps(user)
+        return user
 
     def calculate_points(self):
         """The calculation of points will cause a relatively high load"""
         results = {1: 0, 2: 0, 3: 0, 4: 0}
-        for game in self.games.all():
+        for game in self.games.filter(Games.state == 0).all():
             results[game.get_points(self.id)] += 1
-        self.points = results[4] * 2
-        self.points -= results[1] - results[2]*0.5 - results[3]*0.5
-        self.points = round(self.points)
+        self.points = User.rate_placements(results)
         self.last_rated = date.today()
         db.session.commit()
         return self.points
 
     @staticmethod
-    def get_leaderboard(limit=100):
-        return [user.jsonify(points=True)
-                for user in User.query.order_by(User.points.desc()
-                                                ).limit(limit).all()]
+    def rate_placements(results):
+        """Calculates points from a {placement: count} dict"""
+        points = results[4] * 2
+        points -= results[1] - results[2]*0.5 - results[3]*0.5
+        return round(points)
+
+    @staticmethod
+    def get_leaderboard(limit=100, cursor=None):
+        """Returns (page, next_cursor) of rated users ordered by points"""
+        from app.utils.leaderboard import leaderboard
+        entries, next_cursor = leaderboard.page(limit=limit, cursor=cursor)
+        return entries, next_cursor
 
     # User authentication information
     username = db.Column(db.String(app.config["USER_USERNAME_MAX_LEN"]),
@@ -83,7 +151,7 @@ class User(db.Model):
 
     # User information
     e_mail = db.Column(db.String(app.config["USER_EMAIL_MAX_LEN"]))
-    points = db.Column(db.Integer())
+    points = db.Column(db.Integer(), default=0)
     last_rated = db.Column(db.Date())
     last_seen = db.Column(db.String(100))
     description = db.Column(db.String(300))
@@ -96,6 +164,8 @@ class User(db.Model):
     roles = db.relationship("Role", secondary="user_roles",
                             backref=db.backref("user", lazy="dynamic"))
 
+    __table_args__ = (db.Index("ix_user_points", "points", "id"),)
+
     def __repr__(self):
         return "<User {}>".format(self.username)
 
@@ -158,11 +228,19 @@ class Tournaments(db.Model):
     date = db.Column(db.Date())
     description = db.Column(db.String(250))
     duration = db.Column(db.Integer(), server_default="1", nullable=False)
+    # Last day the tournament is active, maintained by set_end_date
+    end_date = db.Column(db.Date())
     maintainer_id = db.Column(db.Integer(), db.ForeignKey("user.id"))
     tournament_games = db.relationship("Games", secondary="tournament_games",
                                        backref=db.backref("played_games",
                                                           lazy="dynamic"))
 
+    __table_args__ = (
+        db.Index("ix_tournaments_active", "end_date", "date"),
+        db.Index("ix_tournaments_maintainer_active", "maintainer_id",
+                 "end_date"),
+    )
+
     def active(self):
         if date.today() <= self.date or \
            self.date+timedelta(days=self.duration) >= date.today():
@@ -170,58 +248,127 @@ class Tournaments(db.Model):
         else:
             return False
 
+    def pair_round(self, table_size=4):
+        """Returns (tables, byes) of user ids for the next round"""
+        from app.utils.pairing import load_round_data, pair_round
+        return pair_round(*load_round_data(self.id), table_size=table_size)
+
     def find_pair(self, player, init_match=False):
-        """Select two players for a game/ match"""
-        not_matched = [enemy for enemy in
-                       [part for part in self.participants]
-                       if player not in participant.get_games(self).players]
-        try:
-            not_matched.remove(player)
-        except ValueError:
-            warning.warn("Player is not participating in this tournament")
-        if len(not_matched) == 1:
-            return not_matched[0]
-        elif len(not_matched) > 1:
-            return not_matched.sort("points")
-        else:
-            pass
+        """Select the players a player meets in the next round"""
+        tables, byes = self.pair_round()
+        for table in tables:
+            if player.id in table:
+                return [id for id in table if id != player.id]
+        if player.id not in byes:
+            warnings.warn("Player is not participating in this tournament")
+        return []
 
     def add_player(self, player):
-        if TournamentPlayers.query.filter_by(user_id=player.id,
-                                             tournament_id=self.id
-                                             ).first() is None:
-            db.session.add(TournamentPlayers(user_id=player.id,
-                                             tournament_id=self.id))
+        """Uniqueness is enforced by the (tournament_id, user_id) index"""
+        try:
+            with db.session.begin_nested():
+                db.session.add(TournamentPlayers(user_id=player.id,
+                                                 tournament_id=self.id))
             db.session.commit()
-        else:
-            warning.warn("TournamentPlayers Entry was already existing")
+        except IntegrityError:
+            warnings.warn("TournamentPlayers Entry was already existing")
 
     @staticmethod
     def create_tournament(name, maintainer, date, duration=1, players=None):
-        new_tournament = Tournaments(name=name, maintainer_id=maintainer.id,
-                                     date=date, duration=duration)
-        db.session.add(new_tournament)
-        if players is not None:
-            db.session.flush()
-            [new_tournament.add_player(player) for player in players]
+        return Tournaments.create_many([dict(
+            name=name, date=date, duration=duration,
+            participants=[player.id for player in players or []])],
+            maintainer.id)[0]
+
+    @staticmethod
+    def create_many(entries, maintainer_id):
+        """
+        Creates tournaments with their participants in a constant number of
+        statements, entries are dicts of tournament columns and participants
+        Raises ValueError if a participant doesn't exist
+        """
+        if not entries:
+            return []
+        ids = {id for entry in entries for id in entry["participants"]}
+        existing = {id for id, in db.session.query(User.id).filter(
+            User.id.in_(ids))} if ids else set()
+        if ids - existing:
+            raise ValueError(f"Unknown participants {ids - existing}")
+        columns = ["name", "date", "description", "duration"]
+        for entry in entries:
+            unknown = set(entry) - set(columns) - {"participants"}
+            if unknown:
+                raise TypeError(f"Unknown tournament columns {unknown}")
+        # Multi row INSERTs bypass set_end_date, rows need the same keys
+        rows = [dict({column: entry.get(column) for column in columns},
+                     maintainer_id=maintainer_id,
+                     duration=1 if entry.get("duration") is None
+                     else entry["duration"],
+                     end_date=Tournaments.end_date_of(
+                         entry.get("date"), entry.get("duration")))
+                for entry in entries]
+        tournament_ids = insert_returning_ids(Tournaments.__table__, rows)
+        players = [dict(tournament_id=tournament_id, user_id=id)
+                   for tournament_id, entry in zip(tournament_ids, entries)
+                   for id in dict.fromkeys(entry["participants"])]
+        if players:
+            db.session.execute(TournamentPlayers.__table__.insert(), players)
         db.session.commit()
+        tournaments = {tournament.id: tournament for tournament in
+                       Tournaments.query.filter(
+                           Tournaments.id.in_(tournament_ids))}
+        return [tournaments[id] for id in tournament_ids]
+
+    @staticmethod
+    def end_date_of(start, duration):
+        """Last day a tournament starting at start is active"""
+        if start is None:
+            return None
+        # duration falls back to its server default before the insert
+        duration = 1 if duration is None else duration
+        return max(start, start + timedelta(days=duration))
 
     @staticmethod
-    def get_active(limit=10, tournaments=None):
+    def get_active(limit=10, tournaments=None, maintainer_id=None):
         if tournaments is not None:
             return [record for record in tournaments
-                    if record.active() is True][:limit+1]
-        return [record for record in Tournaments.query.all()
-                if record.active() is True][:limit+1]
+                    if record.active() is True][:limit]
+        return Tournaments.active_query(maintainer_id).limit(limit).all()
 
-    def jsonify(self, game_ids=False):
+    @staticmethod
+    def active_query(maintainer_id=None):
+        # end_date >= today is equivalent to active() and uses the index
+        query = Tournaments.query.filter(Tournaments.end_date >= date.today())
+        if maintainer_id is not None:
+            query = query.filter(Tournaments.maintainer_id == maintainer_id)
+        return query.order_by(Tournaments.end_date)
+
+    @staticmethod
+    def with_details(query):
+        """
+        Adds the maintainer's username and the participant count to a query
+        Rows are (tournament, maintainer_username, participants)
+        """
+        participants = db.select([db.func.count(TournamentPlayers.id)]).where(
+            TournamentPlayers.tournament_id == Tournaments.id
+        ).correlate(Tournaments).as_scalar()
+        return query.outerjoin(User, User.id == Tournaments.maintainer_id
+                               ).add_columns(User.username, participants)
+
+    def jsonify(self, game_ids=False, maintainer_username=None,
+                participants=None):
+        """Pass maintainer_username/ participants to avoid lazy loading"""
+        if maintainer_username is None:
+            maintainer_username = self.maintainer.username
+        if participants is None:
+            participants = len(self.participants)
         entry = dict(name=self.name, date=self.date.strftime("%m.%d.%Y"),
                      duration=self.duration, maintainer_id=self.maintainer_id,
-                     maintainer_username=self.maintainer.username, id=self.id,
-                     participants=len(self.participants), active=self.active())
+                     maintainer_username=maintainer_username, id=self.id,
+                     participants=participants, active=self.active())
         if game_ids:
-            entry["game_ids"] = [game.id for game in games]
-        return json.dumps(entry)
+            entry["game_ids"] = [game.id for game in self.games]
+        return entry
 
     participants = db.relationship("User", secondary="tournament_players",
                                    backref=db.backref("participating_in",
@@ -231,6 +378,14 @@ class Tournaments(db.Model):
         return f"<tournament {self.id} at {self.date.strftime('%d.%m.%Y')}>"
 
 
+@db.event.listens_for(Tournaments, "before_insert")
+@db.event.listens_for(Tournaments, "before_update")
+def set_end_date(mapper, connection, tournament):
+    """Keeps end_date in sync with date and duration"""
+    tournament.end_date = Tournaments.end_date_of(tournament.date,
+                                                  tournament.duration)
+
+
 class matchgames(db.Model):
     __tablename__ = "match_games"
 
@@ -252,22 +407,65 @@ class Games(db.Model):
     type = db.Column(db.Boolean(), server_default="1")  # 1 = Master/ Single
     state = db.Column(db.Integer(), server_default="1")
     # States: 1=active/ runnning, 0=not runnning/ finished, 2=ready, 3=paused
+    STATES = {1: "running", 2: "ready", 3: "paused", 0: "finished"}
 
     @staticmethod
     def create_match(rounds=3):
         """For creating round based matches returns a match object"""
         master = Games(date=date.today(), result=None, type=True)
         slaves = [Games(date=date.today(), result=[], type=False)
-                  for _ in range(3)]
-        db.session.add(master)
-        [db.session.add(game) for game in slaves]
-        db.session.commit()
+                  for _ in range(rounds)]
+        db.session.add_all([master] + slaves)
         db.session.flush()
-        [db.session.add(matchgames(slave_id=game.id, master_id=master.id))
-         for game in slaves]
+        db.session.add_all([matchgames(slave_id=game.id, master_id=master.id)
+                            for game in slaves])
         db.session.commit()
         return master
 
+    @staticmethod
+    def create_matches(count, rounds=3, tournament_id=None, tables=None):
+        """
+        Creates count matches with rounds slave games each in a constant
+        number of statements, tables are the player ids of each match
+        Returns the ids of the master games
+        """
+        today = date.today()
+        games = Games.__table__
+        masters = insert_returning_ids(games, [
+            dict(date=today, result=None, type=True, state=2)
+            for _ in range(count)])
+        slaves = insert_returning_ids(games, [
+            dict(date=today, result=[], type=False, state=2)
+            for _ in range(count * rounds)])
+        matches = [[master] + slaves[index * rounds:(index + 1) * rounds]
+                   for index, master in enumerate(masters)]
+        if not matches:
+            return []
+        if rounds:
+            db.session.execute(matchgames.__table__.insert(), [
+                dict(master_id=match[0], slave_id=slave)
+                for match in matches for slave in match[1:]])
+        if tournament_id is not None:
+            db.session.execute(TournamentGames.__table__.insert(), [
+                dict(tournament_id=tournament_id, game_id=game)
+                for match in matches for game in match])
+        if tables:
+            db.session.execute(UserGames.__table__.insert(), [
+                dict(game_id=game, user_id=user_id)
+                for match, table in zip(matches, tables)
+                for game in match for user_id in table])
+        db.session.commit()
+        return masters
+
+    def finish(self, commit=True):
+        """Marks the game as finished and rates its players incrementally"""
+        if self.state == 0:
+            return
+        self.state = 0
+        UserPlacements.apply_result(self)
+        if commit:
+            db.session.commit()
+
     def active(self):
         """Method for checking game state"""
         if self.state == 1 or self.state == 2 or self.state == 3:
@@ -276,8 +474,7 @@ class Games(db.Model):
             return False
 
     def parse_state(self):
-        states = {1: "running", 2: "ready", 3: "paused", 0: "finished"}
-        return states[self.state]
+        return Games.STATES[self.state]
 
     @property
     def player_ids(self):
@@ -293,15 +490,16 @@ class Games(db.Model):
         return points[0]
 
     def jsonify(self, load_players=False):
-        res = dict(id=self.id, result=self.result, players=len(self.result),
+        result = self.result or []
+        res = dict(id=self.id, result=result, players=len(result),
                    type=self.type, date=self.date.strftime("%d.%m.%Y"),
                    state=self.parse_state())
         if load_players:
-            players = [User.get(data["user_id"]).jsonify()
-                       for data in self.result]
-            for i in range(len(res["result"])):
-                res[i]["result"] = dict(points=res["result"][i]["points"],
-                                        user=players[i])
+            players = {user.id: user.jsonify() for user in User.query.filter(
+                User.id.in_([data["user_id"] for data in result]))}
+            res["result"] = [dict(points=data["points"],
+                                  user=players.get(data["user_id"]))
+                             for data in result]
         return res
 
     mastered_rel = db.relationship("Games", secondary="match_games",
@@ -330,6 +528,9 @@ class TournamentGames(db.Model):
     tournament_id = db.Column(db.Integer(), db.ForeignKey("tournaments.id",
                                                           ondelete="CASCADE"))
 
+    __table_args__ = (db.Index("ix_tournament_games_tournament",
+                               "tournament_id", "game_id"),)
+
 
 class UserGames(db.Model):
     __tablename__ = "user_games"
@@ -349,3 +550,361 @@ class TournamentPlayers(db.Model):
                         db.ForeignKey("user.id", ondelete="CASCADE"))
     tournament_id = db.Column(db.Integer(), db.ForeignKey("tournaments.id",
                                                           ondelete="CASCADE"))
+
+    __table_args__ = (db.Index("ix_tournament_players_unique",
+                               "tournament_id", "user_id", unique=True),)
+
+
+class GameResults(db.Model):
+    """Normalized copy of Games.result, one row per player and game"""
+    __tablename__ = "game_results"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    game_id = db.Column(db.Integer(),
+                        db.ForeignKey("games.id", ondelete="CASCADE"),
+                        nullable=False)
+    user_id = db.Column(db.Integer(),
+                        db.ForeignKey("user.id", ondelete="CASCADE"),
+                        nullable=False)
+    placement = db.Column(db.Integer(), nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_game_results_game", "game_id", "user_id", unique=True),
+        db.Index("ix_game_results_user", "user_id", "placement", "game_id"),
+    )
+
+    @staticmethod
+    def rows(game_id, result):
+        """Returns the game_results rows of a Games.result list"""
+        return [dict(game_id=game_id, user_id=entry["user_id"],
+                     placement=entry["points"])
+                for entry in dict((entry["user_id"], entry)
+                                  for entry in result or []).values()]
+
+    def __repr__(self):
+        return "<GameResult g:{}/u:{}>".format(self.game_id, self.user_id)
+
+
+@db.event.listens_for(db.session, "after_flush")
+def sync_game_results(session, flush_context):
+    """Rewrites the game_results rows of games whose result changed"""
+    table = GameResults.__table__
+    changed = [game for game in session.new if isinstance(game, Games)] + \
+        [game for game in session.dirty if isinstance(game, Games) and
+         db.inspect(game).attrs.result.history.has_changes()]
+    deleted = [game.id for game in session.deleted
+               if isinstance(game, Games)]
+    if changed or deleted:
+        session.execute(table.delete().where(table.c.game_id.in_(
+            [game.id for game in changed] + deleted)))
+    rows = [row for game in changed
+            for row in GameResults.rows(game.id, game.result)]
+    if rows:
+        session.execute(table.insert(), rows)
+
+
+class UserPlacements(db.Model):
+    """How often a user placed 1st/ 2nd/ 3rd/ 4th in finished games"""
+    __tablename__ = "user_placements"
+
+    user_id = db.Column(db.Integer(),
+                        db.ForeignKey("user.id", ondelete="CASCADE"),
+                        primary_key=True)
+    first = db.Column(db.Integer(), server_default="0", nullable=False)
+    second = db.Column(db.Integer(), server_default="0", nullable=False)
+    third = db.Column(db.Integer(), server_default="0", nullable=False)
+    fourth = db.Column(db.Integer(), server_default="0", nullable=False)
+    # Bumped on every change so the nightly swap can skip concurrent updates
+    version = db.Column(db.Integer(), server_default="0", nullable=False)
+
+    columns = {1: "first", 2: "second", 3: "third", 4: "fourth"}
+
+    @property
+    def results(self):
+        return {placement: getattr(self, column)
+                for placement, column in UserPlacements.columns.items()}
+
+    @staticmethod
+    def column(placement, user_id, game_id=None):
+        """
+        Column counting a placement, placements outside of 1-4 are skipped
+        everywhere placements are counted, returns None and logs them
+        """
+        column = UserPlacements.columns.get(placement)
+        if column is None:
+            game = f" in game {game_id}" if game_id is not None else ""
+            logging.warning(f"Skipped placement {placement!r} of user "
+                            f"{user_id}{game}, it isn't 1-4")
+        return column
+
+    @staticmethod
+    def apply_result(game):
+        """
+        Adds the placements of a finished game to its players' points
+        Counts are incremented in SQL, so concurrent finishes of games of the
+        same player don't lose increments
+        """
+        from app.utils.results import is_backfilled
+        if not is_backfilled(game.id):
+            # Counted from an empty history, the nightly maintenance
+            # backfills game_results and rates everyone
+            logging.warning("game_results isn't backfilled, rating of game "
+                            f"{game.id} is left to the nightly maintenance")
+            return
+        results = {entry["user_id"]: entry["points"]
+                   for entry in game.result or []}
+        players = [player for player in game.players
+                   if player.id in results and UserPlacements.column(
+                       results[player.id], player.id, game.id)]
+        if not players:
+            return
+        ids = [player.id for player in players]
+        placements = {id: results[id] for id in ids}
+        table = UserPlacements.__table__
+        stored = {user_id for user_id, in db.session.query(
+            UserPlacements.user_id).filter(UserPlacements.user_id.in_(ids))}
+        missing = [id for id in ids if id not in stored]
+        if missing:
+            UserPlacements.seed(missing, game.id)
+        increments = {column: table.c[column] + db.case([(
+            table.c.user_id.in_([id for id in ids
+                                 if placements[id] == placement]), 1)],
+            else_=0)
+            for placement, column in UserPlacements.columns.items()
+            if placement in placements.values()}
+        db.session.execute(table.update().where(table.c.user_id.in_(ids))
+                           .values(version=table.c.version + 1,
+                                   **increments))
+        counts = {row.user_id: row for row in db.session.execute(
+            table.select().where(table.c.user_id.in_(ids)))}
+        for player in players:
+            player.points = User.rate_placements({
+                placement: counts[player.id][column]
+                for placement, column in UserPlacements.columns.items()})
+            player.last_rated = date.today()
+
+    @staticmethod
+    def seed(user_ids, exclude_game_id=None):
+        """
+        Creates the missing records of users from a recount of their
+        finished games (one GROUP BY), e.g. of users rated before
+        user_placements existed
+        Records created meanwhile by a concurrent transaction are kept
+        """
+        records = {user_id: dict(user_id=user_id, first=0, second=0, third=0,
+                                 fourth=0, version=0)
+                   for user_id in user_ids}
+        rows = db.session.query(
+            GameResults.user_id, GameResults.placement, db.func.count()
+        ).join(UserGames, db.and_(UserGames.game_id == GameResults.game_id,
+                                  UserGames.user_id == GameResults.user_id)
+               ).join(Games, Games.id == GameResults.game_id).filter(
+            Games.state == 0, GameResults.user_id.in_(user_ids),
+            GameResults.game_id != exclude_game_id).group_by(
+            GameResults.user_id, GameResults.placement)
+        for user_id, placement, count in rows:
+            column = UserPlacements.column(placement, user_id)
+            if column is not None:
+                records[user_id][column] = count
+        insert_ignore(UserPlacements.__table__, list(records.values()))
+
+    def __repr__(self):
+        return "<UserPlacements u:{}>".format(self.user_id)
+
+
+class RatingSnapshot(db.Model):
+    """Shadow table the nightly rating job is computed into before swapping"""
+    __tablename__ = "rating_snapshot"
+
+    user_id = db.Column(db.Integer(), primary_key=True)
+    first = db.Column(db.Integer(), nullable=False)
+    second = db.Column(db.Integer(), nullable=False)
+    third = db.Column(db.Integer(), nullable=False)
+    fourth = db.Column(db.Integer(), nullable=False)
+    points = db.Column(db.Integer(), nullable=False)
+    # user_placements.version seen before counting, 0 if there was no row
+    version = db.Column(db.Integer(), nullable=False)
+    valid = db.Column(db.Boolean(), server_default="0", nullable=False)
+
+    def __repr__(self):
+        return "<RatingSnapshot u:{}>".format(self.user_id)
+
+
+class AltRatings(db.Model):
+    """Ratings of alternative rating models computed by a replay"""
+    __tablename__ = "alt_ratings"
+
+    model = db.Column(db.String(50), primary_key=True)
+    user_id = db.Column(db.Integer(),
+                        db.ForeignKey("user.id", ondelete="CASCADE"),
+                        primary_key=True)
+    rating = db.Column(db.Float(), nullable=False)
+    games = db.Column(db.Integer(), nullable=False)
+    computed = db.Column(db.DateTime(), nullable=False)
+
+    __table_args__ = (db.Index("ix_alt_ratings_model_rating", "model",
+                               "rating"),)
+
+    def __repr__(self):
+        return "<AltRating {} u:{}>".format(self.model, self.user_id)
+
+
+class Counters(db.Model):
+    """Version counters, e.g. 'leaderboard' is bumped when points change"""
+    __tablename__ = "counters"
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer(), nullable=False)
+
+    @staticmethod
+    def get(name):
+        return db.session.query(Counters.value).filter_by(name=name).scalar()
+
+    @staticmethod
+    def get_many(names):
+        """Returns {name: value} of counters, missing counters are 0"""
+        values = dict(db.session.query(Counters.name, Counters.value).filter(
+            Counters.name.in_(names)))
+        return {name: values.get(name, 0) for name in names}
+
+    @staticmethod
+    def bump(*names, connection=None):
+        """
+        Increments counters as part of the current transaction, missing
+        counters are created by the same atomic upsert, so concurrent first
+        bumps don't fail
+        """
+        connection = connection or db.session
+        dialect = getattr(connection, "dialect", None) or \
+            connection.get_bind().dialect
+        table = Counters.__table__
+        # Sorted, so transactions bumping the same counters lock their rows
+        # in the same order
+        names = sorted(set(names))
+        if dialect.name == "postgresql":
+            statement = postgresql.insert(table).values([
+                dict(name=name, value=1) for name in names])
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.name],
+                set_=dict(value=table.c.value + 1)))
+            return
+        insert_ignore(table, [dict(name=name, value=0) for name in names],
+                      connection=connection)
+        connection.execute(table.update().where(table.c.name.in_(names))
+                           .values(value=table.c.value + 1))
+
+    def __repr__(self):
+        return "<Counter {}: {}>".format(self.name, self.value)
+
+
+class ScheduledJobs(db.Model):
+    """
+    State of background jobs shared by all workers
+    Rows are written in their own transaction so they're visible at once
+    """
+    __tablename__ = "scheduled_jobs"
+
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100))
+    running = db.Column(db.Boolean(), default=False, nullable=False)
+    last_start = db.Column(db.DateTime())
+    last_end = db.Column(db.DateTime())
+    last_duration = db.Column(db.Float())
+    last_status = db.Column(db.String(20))
+    timings = db.Column(db.Text())
+    # Writes are rejected while set, e.g. during the swap of ratings
+    blocking_since = db.Column(db.DateTime())
+
+    @staticmethod
+    def update(name, **values):
+        """Updates (or creates) the state of a job and commits it"""
+        table = ScheduledJobs.__table__
+        with db.engine.begin() as connection:
+            updated = connection.execute(table.update().where(
+                table.c.name == name).values(**values))
+            if updated.rowcount == 0:
+                connection.execute(table.insert().values(name=name, **values))
+
+    @staticmethod
+    def started(name, owner):
+        ScheduledJobs.update(name, owner=owner, running=True,
+                             last_start=datetime.utcnow())
+
+    @staticmethod
+    def finished(name, status, duration, timings=None):
+        ScheduledJobs.update(
+            name, running=False, last_end=datetime.utcnow(),
+            last_status=status, last_duration=round(duration, 3),
+            timings=json.dumps(timings) if timings is not None else None,
+            blocking_since=None)
+
+    @staticmethod
+    def block_writes(name, blocking=True):
+        ScheduledJobs.update(name, blocking_since=datetime.utcnow()
+                             if blocking else None)
+
+    @staticmethod
+    def writes_blocked(timeout):
+        """
+        Returns True if any job blocks writes
+        Blocks older than timeout seconds are left over by crashed workers
+        """
+        since = datetime.utcnow() - timedelta(seconds=timeout)
+        return db.session.query(ScheduledJobs.query.filter(
+            ScheduledJobs.blocking_since > since).exists()).scalar()
+
+    def jsonify(self):
+        return {"name": self.name,
+                "owner": self.owner,
+                "running": self.running,
+                "last_start": self.last_start,
+                "last_end": self.last_end,
+                "last_duration": self.last_duration,
+                "last_status": self.last_status,
+                "timings": json.loads(self.timings) if self.timings else None,
+                "blocking": self.blocking_since is not None}
+
+    def __repr__(self):
+        return "<ScheduledJob {}>".format(self.name)
+
+
+@db.event.listens_for(db.session, "before_flush")
+def bump_leaderboard(session, flush_context, instances):
+    """Invalidates the leaderboard snapshot whenever points change"""
+    if any(isinstance(user, User) for user in session.new) or \
+       any(isinstance(user, User) for user in session.deleted) or \
+       any(isinstance(user, User) and
+           db.inspect(user).attrs.points.history.has_changes()
+           for user in session.dirty):
+        Counters.bump("leaderboard")
+
+
+@db.event.listens_for(db.engine, "begin")
+def reset_written_tables(connection):
+    connection.info["written_tables"] = set()
+
+
+@db.event.listens_for(db.engine, "after_execute")
+def track_written_tables(connection, clauseelement, multiparams, params,
+                         result):
+    """Remembers the tables written in a transaction, ORM and Core alike"""
+    # Autocommitted statements (e.g. engine.execute) are already committed
+    if connection.closed or not connection.in_transaction():
+        return
+    if isinstance(clauseelement, UpdateBase) and \
+       clauseelement.table.name != Counters.__tablename__:
+        connection.info.setdefault("written_tables", set()).add(
+            clauseelement.table.name)
+
+
+@db.event.listens_for(db.engine, "commit")
+def bump_written_tables(connection):
+    """
+    Bumps the 'table:<name>' counter of every table written on commit
+    One statement right before the COMMIT, the counter rows are locked only
+    while the transaction commits
+    """
+    tables = connection.info.pop("written_tables", None)
+    if tables:
+        Counters.bump(*(f"table:{name}" for name in tables),
+                      connection=connection)
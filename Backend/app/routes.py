@@ -1,9 +1,18 @@
 import logging
-from flask import render_template, g, request, abort, jsonify, make_response
+import io
+from flask import (render_template, g, request, abort, jsonify, make_response,
+                   Response, stream_with_context)
 from datetime import datetime, date
-from sqlalchemy.exc import OperationalError
-from app.models import User, Tournaments, TournamentPlayers
-from app.utils import requeries_json_keys
+from sqlalchemy.exc import OperationalError, IntegrityError
+from app.models import User, Tournaments, Games, GameResults, ScheduledJobs
+from app.utils import requeries_json_keys, role_required
+from app.utils import httpcache, metrics, transfer
+from app.utils.httpcache import cached
+from app.utils.pagination import paginate
+from app.utils.streaming import stream_response, encode
+from app.utils.events import broker
+from app.utils.leaderboard import leaderboard
+from app.utils.auth import verify_token, verify_credentials
 from app import app, auth, db
 
 
@@ -12,6 +21,17 @@ def index():
     return render_template("index.html")
 
 
+def get_limit(default, all=True):
+    """
+    Returns the limit argument, limit=0 requests all records unless all is
+    False, aborts with 400 if it's negative
+    """
+    limit = request.args.get("limit", default=default, type=int)
+    if limit is not None and limit < 0:
+        return abort(400)
+    return None if limit == 0 and all else limit
+
+
 @app.route("/api/user/token", methods=["GET"])
 @auth.login_required
 def get_auth_token():
@@ -25,30 +45,60 @@ def get_auth_token():
 @auth.verify_password
 def verify_password(username_or_token, password):
     # first try to authenticate by token
-    user = User.verify_auth_token(username_or_token)
+    user = verify_token(username_or_token)
     if not user:
         # try to authenticate with username/password
-        user = User.query.filter_by(username=username_or_token).first()
-        if not user or not user.verify_password(password):
+        user = verify_credentials(username_or_token, password,
+                                  request.remote_addr)
+        if not user:
             return False
     g.user = user
     return True
 
 
 @app.route("/api/user/leaderboard", methods=["GET"])
+@cached(["leaderboard"], params=["limit", "cursor"])
 def get_leaderboard():
-    limit = request.args.get("limit", default=100, type=int)
-    return jsonify(User.get_leaderboard(limit=limit))
+    limit = get_limit(100)
+    cursor = request.args.get("cursor", default=None)
+    entries, next_cursor = User.get_leaderboard(limit=limit, cursor=cursor)
+    return stream_response(entries, next_cursor=next_cursor)
+
+
+@app.route("/api/user/<int:id>/rank", methods=["GET"])
+@cached(["leaderboard"], params=["neighbours"])
+def get_rank(id):
+    neighbours = request.args.get("neighbours", default=5, type=int)
+    entry, entries = leaderboard.around(id, neighbours=neighbours)
+    if entry is None:
+        return abort(404)
+    return jsonify({"rank": entry["rank"], "user": entry,
+                    "neighbours": entries})
+
+
+@app.route("/api/user/<int:id>/results", methods=["GET"])
+def get_user_results(id):
+    limit = get_limit(100)
+    placement = request.args.get("placement", default=None, type=int)
+    cursor = request.args.get("cursor", default=None)
+    query = GameResults.query.filter_by(user_id=id)
+    if placement is not None:
+        query = query.filter_by(placement=placement)
+    results, next_cursor = paginate(query, [GameResults.game_id],
+                                    lambda result: [result.game_id],
+                                    cursor=cursor, limit=limit)
+    return stream_response(results, lambda result: dict(
+        game_id=result.game_id, placement=result.placement), next_cursor)
 
 
 @app.route("/api/user/list", methods=["GET"])
 def list_players():
-    limit = request.args.get("limit", default=100)
-    if limit is None:
-        players = [user.jsonify() for user in User.query.all()]
-    else:
-        players = [user.jsonify() for user in User.query.limit(limit).all()]
-    return jsonify(players)
+    limit = get_limit(100)
+    cursor = request.args.get("cursor", default=None)
+    players, next_cursor = paginate(User.query, [User.id],
+                                    lambda user: [user.id],
+                                    cursor=cursor, limit=limit)
+    return stream_response(players, User.jsonify, next_cursor)
 
 
 @app.route("/api/user/sign-up", methods=["POST"])
@@ -70,72 +120,154 @@ def new_user():
     return jsonify({"username": user.username}), 201
 
 
-@app.route("/api/tournaments/create", methods=["POST"])
-@auth.login_required
-@requeries_json_keys(["name", "date", "duration",
-                      "description", "participants"])
-def create_tournament():
-    r = request.get_json()
+def tournament_details(row):
+    """Serializes a row of Tournaments.with_details"""
+    record, username, participants = row
+    return record.jsonify(maintainer_username=username,
+                          participants=participants)
+
+
+def parse_tournament(r):
+    """Returns the column values of a tournament from a request dict"""
+    return dict(name=r["name"], duration=int(r["duration"]),
+                description=r["description"],
+                date=datetime.fromisoformat(r["date"][:10]).date(),
+                participants=[int(id) for id in r["participants"]])
+
+
+def create_tournaments(entries):
+    """Creates tournaments maintained by g.user and returns their json"""
     try:
-        t = Tournaments(name=r["name"], maintainer_id=g.user.id,
-                        duration=int(r["duration"]),
-                        description=r["description"],
-                        date=datetime.fromisoformat(r["date"][:10]).date())
-        db.session.add(t)
-        db.session.flush()
-        [db.session.add(TournamentPlayers(user_id=id, tournament_id=t.id))
-         for id in r["participants"]]
-        db.session.commit()
+        tournaments = Tournaments.create_many(
+            [parse_tournament(entry) for entry in entries], g.user.id)
     except OperationalError as e:
         logging.debug(f"Operationaleroor {e}")
         db.session.rollback()
         return abort(400)
-    except ValueError as e:
-        logging.debug(f"ValueError {e}")
+    except (ValueError, KeyError, TypeError) as e:
+        logging.debug(f"{type(e).__name__} {e}")
         db.session.rollback()
         return abort(400)
-    return jsonify(t.jsonify())
+    query = Tournaments.with_details(Tournaments.query.filter(
+        Tournaments.id.in_([t.id for t in tournaments])))
+    return [tournament_details(row)
+            for row in query.order_by(Tournaments.id).all()]
+
+
+@app.route("/api/tournaments/create", methods=["POST"])
+@auth.login_required
+@requeries_json_keys(["name", "date", "duration",
+                      "description", "participants"])
+def create_tournament():
+    return jsonify(create_tournaments([request.get_json()])[0])
+
+
+@app.route("/api/tournaments/bulk", methods=["POST"])
+@auth.login_required
+@requeries_json_keys(["tournaments"])
+def create_tournaments_bulk():
+    entries = request.get_json()["tournaments"]
+    if not isinstance(entries, list):
+        return abort(400)
+    return jsonify(create_tournaments(entries)), 201
 
 
 @app.route("/api/tournaments/ongoing", methods=["GET"])
+@cached(["tournaments", "tournament_players", "user"],
+        params=["limit", "maintainer_id"])
 def list_ongoing_tournaments():
-    limit = request.args.get("limit", default=10, type=int)
+    limit = get_limit(10, all=False)
     maintainer_id = request.args.get("maintainer_id", default=None, type=int)
-    if maintainer_id is not None:
-        return jsonify([record.jsonify()
-                        for record in Tournaments.get_active(limit, maintainer_id=maintainer_id)])
-    return jsonify([record.jsonify()
-                    for record in Tournaments.get_active(limit)])
+    query = Tournaments.with_details(Tournaments.active_query(maintainer_id))
+    return jsonify([tournament_details(row)
+                    for row in query.limit(limit).all()])
 
 
 @app.route("/api/tournaments/list", methods=["GET"])
+@cached(["tournaments", "tournament_players", "user"],
+        params=["limit", "maintainer_id", "cursor"])
 def list_tournaments():
-    limit = request.args.get("limit", default=10, type=int)
+    limit = get_limit(10)
     maintainer_id = request.args.get("maintainer_id", default=None, type=int)
+    cursor = request.args.get("cursor", default=None)
+    query = Tournaments.query
     if maintainer_id is not None:
-        t = Tournaments.query.filter_by(maintainer_id=maintainer_id
-                                        ).limit(limit).all()
-        return jsonify([record.jsonify() for record in t])
-    return jsonify([record.jsonify()
-                    for record in Tournaments.query.limit(limit).all()])
+        query = query.filter_by(maintainer_id=maintainer_id)
+    rows, next_cursor = paginate(Tournaments.with_details(query),
+                                 [Tournaments.id], lambda row: [row[0].id],
+                                 cursor=cursor, limit=limit)
+    return stream_response(rows, tournament_details, next_cursor)
 
 
 @app.route("/api/tournament/<int:id>/games", methods=["GET"])
+@cached(["games", "tournament_games"], params=["limit", "cursor"])
 def get_tournament_games(id):
-    limit = request.args.get("limit", default=None, type=int)
+    limit = get_limit(None)
     active = request.args.get("ongoing", default=True)
     load_players = request.args.get("load_players", default=False)
-    query = Tournaments.query.get_or_404(id).games
-    if limit is not None:
-        query = query.limit(limit)
-    games = query.all()
-    return jsonify([game.jsonify() for game in games])
+    cursor = request.args.get("cursor", default=None)
+    games, next_cursor = paginate(Tournaments.query.get_or_404(id).games,
+                                  [Games.id], lambda game: [game.id],
+                                  cursor=cursor, limit=limit)
+    return stream_response(games, Games.jsonify, next_cursor)
+
+
+@app.route("/api/tournament/<int:id>/events", methods=["GET"])
+def stream_tournament_events(id):
+    """
+    Server-sent events of game state and result changes of a tournament
+    Each stream holds a thread (see the Procfile), at most
+    EVENT_STREAMS_MAX per worker, clients retry after 503
+    """
+    Tournaments.query.get_or_404(id)
+    db.session.remove()
+    subscription = broker.subscribe(
+        id, request.headers.get("Last-Event-ID", default=None, type=int))
+    if subscription is None:
+        return make_response(jsonify({"error": "Too many event streams"}),
+                             503, {"Retry-After": "30"})
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            for event in broker.listen(subscription):
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"id: {event[0]}\nevent: game\n" \
+                          f"data: {encode(event[1])}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
+@app.route("/api/tournament/<int:id>/round", methods=["POST"])
+@auth.login_required
+def schedule_round(id):
+    """Pairs all participants and creates the matches of the next round"""
+    t = Tournaments.query.get_or_404(id)
+    if t.maintainer_id != g.user.id:
+        return abort(403)
+    rounds = (request.get_json(silent=True) or {}).get("rounds", 3)
+    if not isinstance(rounds, int) or rounds < 1:
+        return abort(400)
+    tables, byes = t.pair_round()
+    matches = Games.create_matches(len(tables), rounds=rounds,
+                                   tournament_id=t.id, tables=tables)
+    return jsonify({"matches": [{"id": master, "players": table}
+                                for master, table in zip(matches, tables)],
+                    "byes": byes}), 201
 
 
 @app.route("/api/tournaments/<int:id>/info", methods=["GET"])
+@cached(["tournaments", "tournament_players", "user"])
 def get_tournament_info(id):
-    t = Tournaments.get_or_404(id)
-    return jsonify(t.jsonify())
+    row = Tournaments.with_details(Tournaments.query.filter_by(id=id)).first()
+    if row is None:
+        return abort(404)
+    return jsonify(tournament_details(row))
 
 
 @app.route("/api/tournament/<int:id>/edit", methods=["POST"])
@@ -189,6 +321,76 @@ def get_games(id):
     limit = request.args.get("limit", default=10, type=int)
 
 
+@app.route("/api/admin/cache", methods=["GET"])
+@auth.login_required
+@role_required(["admin"])
+def get_cache_stats():
+    return jsonify(dict(httpcache.stats, backend=app.config["CACHE_URL"]))
+
+
+@app.route("/api/admin/jobs", methods=["GET"])
+@auth.login_required
+@role_required(["admin"])
+def get_jobs():
+    return jsonify([job.jsonify() for job in ScheduledJobs.query.all()])
+
+
+@app.route("/api/admin/metrics", methods=["GET"])
+@auth.login_required
+@role_required(["admin"])
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+
+@app.route("/api/admin/export/<table>", methods=["GET"])
+@auth.login_required
+@role_required(["admin"])
+def export_table(table):
+    """Streams a table or 'all' tables as NDJSON or CSV (?format=csv)"""
+    format = request.args.get("format", default="ndjson")
+    if format not in transfer.FORMATS or (table != "all" and
+                                          table not in transfer.TABLES) or \
+       (table == "all" and format != "ndjson"):
+        return abort(400)
+    chunks = transfer.export_all() if table == "all" else \
+        transfer.export_table(table, format)
+    return Response(stream_with_context(chunks), mimetype="text/csv"
+                    if format == "csv" else "application/x-ndjson")
+
+
+@app.route("/api/admin/import/<table>", methods=["POST"])
+@auth.login_required
+@role_required(["admin"])
+def import_table(table):
+    """Imports an export streamed as request body, see export_table"""
+    format = request.args.get("format", default="ndjson")
+    if format not in transfer.FORMATS or (table == "all" and
+                                          format != "ndjson"):
+        return abort(400)
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8")
+    try:
+        counts = transfer.import_records(transfer.read_records(
+            lines, format, None if table == "all" else table))
+    except transfer.PartialImport as e:
+        if isinstance(e.error, IntegrityError):
+            status = 409
+        elif isinstance(e.error, (ValueError, KeyError, TypeError)):
+            status = 400
+        else:
+            status = 500
+        if Games.__tablename__ in e.counts:
+            transfer.repair_ratings_later()
+        # Chunks committed before the error stay imported
+        return make_response(jsonify({"error": str(e), "imported": e.counts,
+                                      "repairing_ratings":
+                                      Games.__tablename__ in e.counts}),
+                             status)
+    if Games.__tablename__ in counts:
+        transfer.repair_ratings_later()
+    return jsonify({"imported": counts,
+                    "repairing_ratings": Games.__tablename__ in counts}), 201
+
+
 @app.route("/api/gui/changelog")
 def get_changelog():
     changelog = """
@@ -206,8 +408,9 @@ def unauthorized():
 
 @app.before_request
 def before_request_hook():
-    """Hook for signal if maintenance's ongoing"""
-    if app.maintenance:
+    """Hook for signal if maintenance's ongoing, only writes are blocked"""
+    if request.method not in ("GET", "HEAD", "OPTIONS") and \
+       ScheduledJobs.writes_blocked(app.config["MAINTENANCE_BLOCK_TIMEOUT"]):
         e = "The server is currently unable to handle the request due to a \
              temporary overloading or maintenance of the server."
         return make_response(jsonify({"error": e}), 503)
@@ -0,0 +1,76 @@
+import random
+from flask import has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.sql.expression import UpdateBase
+
+
+def replica_binds(config):
+    """Bind keys of the configured replicas, see Config.SQLALCHEMY_BINDS"""
+    return [f"replica{index}"
+            for index in range(len(config["DATABASE_REPLICAS"]))]
+
+
+def is_write(clause):
+    """Inserts, updates, deletes and SELECT ... FOR UPDATE"""
+    return isinstance(clause, UpdateBase) or \
+        getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(SignallingSession):
+    """
+    Reads of GET requests are sent to one replica per transaction, flushes,
+    writes and everything outside of GET requests to the primary
+    A transaction which wrote reads from the primary afterwards and the
+    client reads from the primary for REPLICA_STICKY_SECONDS
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or is_write(clause):
+            if not self.info.get("wrote"):
+                self.info["wrote"] = True
+                self.info["bind"] = None
+                if has_request_context():
+                    # Local import, app.utils imports the models
+                    from app.utils.replicas import remember_write
+                    remember_write()
+        elif "bind" not in self.info:
+            bind = self.choose_replica()
+            if bind is not False:
+                self.info["bind"] = bind
+        if self.info.get("bind"):
+            return self.db.get_engine(self.app, bind=self.info["bind"])
+        return super().get_bind(mapper, clause)
+
+    def choose_replica(self):
+        """
+        Returns the bind key of a replica or None for the primary
+        False if the client isn't known yet (e.g. the authentication's own
+        queries), the read goes to the primary and the next one chooses again
+        """
+        binds = replica_binds(self.app.config)
+        if not binds or not has_request_context():
+            return None
+        from app.utils.replicas import reads_from_replica
+        reads = reads_from_replica()
+        if reads is None:
+            return False
+        return random.choice(binds) if reads else None
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def forget_bind(session, transaction):
+    # The next transaction may read from another replica
+    if transaction.parent is None:
+        session.info.pop("bind", None)
+        session.info.pop("wrote", None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -1,5 +1,6 @@
-from app import db, cron
+from app import db
 from app.models import Role
+from app.utils.cache import get_cache
 from datetime import date, timedelta
 from flask import request, abort, g
 from simplejson.errors import JSONDecodeError
@@ -23,32 +24,39 @@ def requeries_json_keys(keys):
     return actual_decorator
 
 
+# Role names to ids, cleared when a role is added, changed or deleted
+role_ids = get_cache("roles", ttl=300)
+
+
+@db.event.listens_for(Role, "after_insert")
+@db.event.listens_for(Role, "after_update")
+@db.event.listens_for(Role, "after_delete")
+def invalidate_role_ids(mapper, connection, target):
+    role_ids.clear()
+
+
+def get_role_id(name):
+    """Returns the id of a role by name, all roles are loaded at once"""
+    ids = role_ids.get("ids", {})
+    if name not in ids:
+        ids = dict(db.session.query(Role.name, Role.id).all())
+        role_ids.set("ids", ids)
+    return ids.get(name)
+
+
 def role_required(names):
     def actual_decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            roles = [Role.query.filter_by(name=name).first() for name in names]
-            if len([role for role in roles if role not in g.user.roles]) >= 1:
+            user_roles = {role.id for role in g.user.roles}
+            if len([name for name in names
+                    if get_role_id(name) not in user_roles]) >= 1:
                 return abort(403)
             return func(*args, **kwargs)
         return wrapper
     return actual_decorator
 
 
-def vacuum_db():
-    """
-    Runs vacuum at Database
-    https://stackoverflow.com/questions/2128336/what-does-it-mean-to-vacuum-a-database
-    """
-    with db.engine.begin() as conn:
-        conn.execute("VACUUM")
-
-
 def tomorrow():
     """Returns date object for tomorrow"""
     return date.today() + timedelta(days=1)
-
-
-def schuedle_maintenance():
-    """schuedles Maintenance"""
-    return cron.add_job(utils.maintenance, "date", date=utils.tomorrow())
@@ -0,0 +1,85 @@
+import hashlib
+import hmac
+import time
+from app import app, db
+from app.models import User, Role
+from app.utils.cache import TTLCache, get_cache
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+# (id, role ids) of users of verified tokens, keyed by a hash of the token
+users = get_cache("auth", ttl=app.config["AUTH_CACHE_TTL"])
+# (id, role ids) of verified passwords, keyed by an HMAC of the credentials
+# and kept within this worker
+passwords = TTLCache(maxsize=app.config["CACHE_LOCAL_SIZE"],
+                     ttl=app.config["AUTH_CACHE_TTL"])
+# Failed password logins per username and client address
+failed = get_cache("auth-failed", ttl=app.config["AUTH_FAILED_WINDOW"])
+
+
+def load_user(id):
+    return User.query.options(db.joinedload(User.roles)).get(id)
+
+
+def identity(user):
+    """What is cached of a verified user"""
+    return user.id, tuple(role.id for role in user.roles)
+
+
+def detached(model, **values):
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return instance
+
+
+def attach(identity):
+    """
+    Returns the user of an identity attached to the session without a query,
+    attributes other than id and roles are loaded on access
+    """
+    id, role_ids = identity
+    user = detached(User, id=id)
+    set_committed_value(user, "roles", [detached(Role, id=role_id)
+                                        for role_id in role_ids])
+    return db.session.merge(user, load=False)
+
+
+def verify_token(token):
+    """Returns the user of a valid token, cached until the token expires"""
+    key = ("token", hashlib.sha256(token.encode()).digest())
+    cached = users.get(key)
+    if cached is not None:
+        return attach(cached)
+    data, header = User.load_auth_token(token)
+    if data is None:
+        return None
+    user = load_user(data["id"])
+    if user is None:
+        return None
+    ttl = min(header["exp"] - time.time(), users.ttl)
+    users.set(key, identity(user), ttl=ttl)
+    return user
+
+
+def verify_credentials(username, password, address=None):
+    """
+    Returns the user if the password is valid
+    Valid passwords are cached, a client address with too many failed
+    attempts for a username is rejected without hashing
+    """
+    key = hmac.new(app.config["SECRET_KEY"].encode(), "\0".join(
+        [username, password]).encode(), hashlib.sha256).digest()
+    cached = passwords.get(key)
+    if cached is not None:
+        return attach(cached)
+    attempts = (username, address)
+    if failed.get(attempts, 0) >= app.config["AUTH_MAX_FAILED"]:
+        return None
+    user = User.query.options(db.joinedload(User.roles)
+                              ).filter_by(username=username).first()
+    if not user or not user.verify_password(password):
+        failed.incr(attempts)
+        return None
+    failed.pop(attempts)
+    passwords.set(key, identity(user))
+    return user
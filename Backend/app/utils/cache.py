@@ -0,0 +1,318 @@
+import pickle
+import sqlite3
+import threading
+import time
+from app import app
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """
+    Thread safe LRU cache with a time to live per entry
+    With maxbytes entries are also evicted once the sizes of all entries
+    (sizeof of their values) exceed maxbytes
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.bytes = 0
+        # key -> (expires, value, size)
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                expires, value, _ = self.data[key]
+            except KeyError:
+                return default
+            if expires <= time.monotonic():
+                self.remove(key)
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = self.sizeof(value) if self.maxbytes else 0
+        with self.lock:
+            self.remove(key)
+            if self.maxbytes and size > self.maxbytes:
+                return
+            self.data[key] = (time.monotonic() + ttl, value, size)
+            self.bytes += size
+            while len(self.data) > self.maxsize or \
+                    (self.maxbytes and self.bytes > self.maxbytes):
+                self.bytes -= self.data.popitem(last=False)[1][2]
+
+    def incr(self, key, ttl=None):
+        """
+        Increments a counter and returns it, the counter expires ttl seconds
+        after its first increment
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.remove(key)
+                ttl = self.ttl if ttl is None else ttl
+                entry = (time.monotonic() + ttl, 0, 0)
+            self.data[key] = (entry[0], entry[1] + 1, entry[2])
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.bytes -= self.data.popitem(last=False)[1][2]
+            return entry[1] + 1
+
+    def remove(self, key):
+        """Removes an entry, the lock has to be held"""
+        entry = self.data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+        return entry
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.remove(key)
+            return default if entry is None else entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self.data)
+
+
+class LocalBackend(object):
+    """In-process LRU with TTL, only consistent within one worker"""
+
+    def __init__(self, maxsize=8192, maxbytes=None, sizeof=None):
+        self.data = TTLCache(maxsize=maxsize, maxbytes=maxbytes,
+                             sizeof=sizeof)
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl):
+        self.data.set(key, value, ttl=ttl)
+
+    def incr(self, key, ttl):
+        return self.data.incr(key, ttl=ttl)
+
+    def delete(self, key):
+        self.data.pop(key)
+
+    def generation(self, name):
+        return self.generations.get(name, 0)
+
+    def bump(self, name):
+        with self.lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+
+
+class SQLiteBackend(object):
+    """
+    Cache in a SQLite file shared by all workers on one machine
+    Values are pickled, expired entries are purged every purge_every sets
+    """
+
+    def __init__(self, path, purge_every=1000):
+        self.path = path
+        self.purge_every = purge_every
+        self.sets = 0
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT "
+                               "PRIMARY KEY, value BLOB, expires REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS generations ("
+                               "name TEXT PRIMARY KEY, value INTEGER)")
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return self.local.connection
+
+    def get(self, key):
+        row = self.connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?",
+            (key, time.time())).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        connection = self.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) "
+            "VALUES (?, ?, ?)", (key, pickle.dumps(value), time.time() + ttl))
+        self.sets += 1
+        if self.sets % self.purge_every == 0:
+            connection.execute("DELETE FROM cache WHERE expires <= ?",
+                               (time.time(),))
+
+    def incr(self, key, ttl):
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value, expires FROM cache WHERE key = ? AND "
+                "expires > ?", (key, time.time())).fetchone()
+            value, expires = (pickle.loads(row[0]) + 1, row[1]) if row \
+                else (1, time.time() + ttl)
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) "
+                "VALUES (?, ?, ?)", (key, pickle.dumps(value), expires))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return value
+
+    def delete(self, key):
+        self.connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def generation(self, name):
+        row = self.connection().execute(
+            "SELECT value FROM generations WHERE name = ?", (name,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def bump(self, name):
+        connection = self.connection()
+        connection.execute("INSERT OR IGNORE INTO generations (name, value) "
+                           "VALUES (?, 0)", (name,))
+        connection.execute("UPDATE generations SET value = value + 1 "
+                           "WHERE name = ?", (name,))
+
+
+class RedisBackend(object):
+    """Cache on a (local) Redis compatible server, requires redis-py"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL requires the redis package")
+        self.redis = redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def incr(self, key, ttl):
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    value, remaining = pipe.get(key), pipe.pttl(key)
+                    if value is None or remaining <= 0:
+                        value, remaining = 1, int(ttl * 1000)
+                    else:
+                        value = pickle.loads(value) + 1
+                    pipe.multi()
+                    pipe.set(key, pickle.dumps(value), px=remaining)
+                    pipe.execute()
+                    return value
+                except self.redis.WatchError:
+                    continue
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def generation(self, name):
+        return int(self.client.get(f"generation:{name}") or 0)
+
+    def bump(self, name):
+        self.client.incr(f"generation:{name}")
+
+
+class Cache(object):
+    """
+    Namespace of a cache backend
+    clear() bumps the namespace's generation in the backend, so entries of
+    every worker sharing the backend are invalidated at once
+    """
+
+    def __init__(self, backend, namespace, ttl=60, generation_ttl=1):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        # The generation is checked at most every generation_ttl seconds
+        self.generation_ttl = generation_ttl
+        self.current = (0, None)
+
+    def prefix(self):
+        expires, generation = self.current
+        if expires <= time.monotonic():
+            generation = self.backend.generation(self.namespace)
+            self.current = (time.monotonic() + self.generation_ttl,
+                            generation)
+        return f"{self.namespace}:{generation}:"
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.prefix() + repr(key))
+        return default if value is None else value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl > 0:
+            self.backend.set(self.prefix() + repr(key), value, ttl)
+
+    def incr(self, key, ttl=None):
+        """Atomically increments a counter, its expiry isn't extended"""
+        return self.backend.incr(self.prefix() + repr(key),
+                                 self.ttl if ttl is None else ttl)
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self.backend.delete(self.prefix() + repr(key))
+        return value
+
+    def clear(self):
+        self.backend.bump(self.namespace)
+        self.current = (0, None)
+
+
+backends = {}
+
+
+def get_backend(url):
+    """Returns the backend for a CACHE_URL, one instance per process"""
+    if url not in backends:
+        if url == "local":
+            backends[url] = LocalBackend(app.config["CACHE_LOCAL_SIZE"])
+        elif url.startswith("sqlite:///"):
+            backends[url] = SQLiteBackend(url[len("sqlite:///"):])
+        elif url.startswith(("redis://", "rediss://", "unix://")):
+            backends[url] = RedisBackend(url)
+        else:
+            raise ValueError(f"Unsupported CACHE_URL {url}")
+    return backends[url]
+
+
+def get_cache(namespace, ttl=60, maxbytes=None, sizeof=None):
+    """
+    Returns a namespace of the configured cache backend
+    With maxbytes a local namespace gets an LRU of its own, bounded by the
+    sizes of its values (sizeof), so large values can't evict the small
+    entries of other namespaces
+    """
+    url = app.config["CACHE_URL"]
+    if url == "local" and maxbytes:
+        backends[f"local:{namespace}"] = LocalBackend(
+            app.config["CACHE_LOCAL_SIZE"], maxbytes=maxbytes, sizeof=sizeof)
+        return Cache(backends[f"local:{namespace}"], namespace, ttl=ttl)
+    return Cache(get_backend(url), namespace, ttl=ttl)
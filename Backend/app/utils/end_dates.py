@@ -0,0 +1,55 @@
+import logging
+from app import db
+from app.models import Tournaments
+
+
+def add_end_date_column():
+    """
+    Adds end_date and its indexes to a tournaments table created before
+    them, create_all doesn't alter existing tables
+    Returns True if the column was added
+    """
+    table = Tournaments.__table__
+    inspector = db.inspect(db.engine)
+    if "end_date" in {column["name"]
+                      for column in inspector.get_columns(table.name)}:
+        return False
+    with db.engine.begin() as connection:
+        connection.execute(f'ALTER TABLE "{table.name}" ADD COLUMN end_date '
+                           f"{table.c.end_date.type.compile(db.engine.dialect)}")
+        for index in table.indexes:
+            if "end_date" in index.columns:
+                index.create(connection)
+    logging.info("Added tournaments.end_date")
+    return True
+
+
+def end_date_expression(table, dialect):
+    """date + duration days in SQL, like set_end_date"""
+    duration = db.func.coalesce(table.c.duration, 1)
+    if dialect == "sqlite":
+        end = db.func.date(table.c.date, db.cast(duration, db.String) +
+                           " days")
+    elif dialect == "postgresql":
+        end = table.c.date + duration
+    else:
+        raise RuntimeError(f"Backfilling end_date isn't supported on "
+                           f"{dialect}")
+    return db.case([(duration > 0, end)], else_=table.c.date)
+
+
+def backfill_end_dates(all=False):
+    """
+    Sets end_date of tournaments without one (of all with all) in a single
+    UPDATE, returns the number of updated tournaments
+    """
+    add_end_date_column()
+    table = Tournaments.__table__
+    statement = table.update().values(end_date=end_date_expression(
+        table, db.engine.dialect.name))
+    if not all:
+        statement = statement.where(table.c.end_date.is_(None))
+    updated = db.session.execute(statement).rowcount
+    db.session.commit()
+    logging.info(f"Backfilled end_date of {updated} tournaments")
+    return updated
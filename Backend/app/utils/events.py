@@ -0,0 +1,159 @@
+import itertools
+import queue
+import threading
+from app import app, db
+from app.models import Games, TournamentGames
+from collections import deque, OrderedDict
+
+
+class Subscription(object):
+
+    def __init__(self, tournament_id, queue_size):
+        self.tournament_id = tournament_id
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Set when the client stopped reading, the stream is closed and the
+        # client reconnects with Last-Event-ID
+        self.overflowed = False
+
+
+class Broker(object):
+    """
+    In-process pub/sub of game updates per tournament
+    Every subscriber gets its own queue, a commit costs one put per
+    subscriber instead of one query per subscriber and poll interval
+    """
+
+    def __init__(self, backlog=100, queue_size=1000, tournaments=1000,
+                 max_subscriptions=None):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.count = 0
+        # Every subscription holds a request thread
+        self.max_subscriptions = max_subscriptions
+        # Recent events of the last published tournaments (an LRU of at
+        # most tournaments entries) for clients reconnecting with
+        # Last-Event-ID, ids are only unique within this process
+        self.recent = OrderedDict()
+        self.tournaments = tournaments
+        self.backlog = backlog
+        self.queue_size = queue_size
+        self.ids = itertools.count(1)
+
+    def subscribe(self, tournament_id, last_event_id=None):
+        """Returns a subscription or None if there are too many"""
+        subscription = Subscription(tournament_id, self.queue_size)
+        with self.lock:
+            if self.max_subscriptions is not None and \
+               self.count >= self.max_subscriptions:
+                return None
+            self.count += 1
+            self.subscriptions.setdefault(tournament_id, set()).add(
+                subscription)
+            if last_event_id is not None:
+                for event in self.recent.get(tournament_id, ()):
+                    if event[0] > last_event_id:
+                        subscription.queue.put_nowait(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(
+                subscription.tournament_id, set())
+            if subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self.count -= 1
+            if not subscriptions:
+                self.subscriptions.pop(subscription.tournament_id, None)
+
+    def publish(self, tournament_id, data):
+        """Returns the id of the event"""
+        with self.lock:
+            event = (next(self.ids), data)
+            self.recent.setdefault(tournament_id, deque(
+                maxlen=self.backlog)).append(event)
+            self.recent.move_to_end(tournament_id)
+            while len(self.recent) > self.tournaments:
+                self.recent.popitem(last=False)
+            for subscription in self.subscriptions.get(tournament_id, ()):
+                if subscription.overflowed:
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    subscription.overflowed = True
+        return event[0]
+
+    def listen(self, subscription, timeout=15):
+        """
+        Yields (id, data) events, None after timeout seconds without one
+        Stops once an event was dropped, so the client reconnects with the
+        id of the last event it actually received
+        """
+        while not subscription.overflowed:
+            try:
+                yield subscription.queue.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+
+
+broker = Broker(max_subscriptions=app.config["EVENT_STREAMS_MAX"])
+
+
+def game_event(game):
+    """State and result of a game, expired attributes are loaded"""
+    values = db.inspect(game).dict
+    state = values["state"] if "state" in values else game.state
+    result = (values["result"] if "result" in values else game.result) or []
+    return dict(id=game.id, state=Games.STATES.get(state), result=result,
+                players=len(result))
+
+
+@db.event.listens_for(db.session, "after_flush")
+def collect_game_events(session, flush_context):
+    """Remembers state and result changes of games until the commit"""
+    changed = [game for game in session.dirty if isinstance(game, Games) and
+               (db.inspect(game).attrs.state.history.has_changes() or
+                db.inspect(game).attrs.result.history.has_changes())] + \
+        [game for game in session.new if isinstance(game, Games)]
+    if not changed:
+        return
+    events = {game.id: game_event(game) for game in changed}
+    table = TournamentGames.__table__
+    rows = session.execute(db.select([
+        table.c.tournament_id, table.c.game_id]).where(
+        table.c.game_id.in_(list(events)))).fetchall()
+    # The transaction of the flush, its events are dropped if it or one of
+    # its parents (e.g. a savepoint) is rolled back
+    pending = session.info.setdefault("game_events", [])
+    pending.extend((session.transaction, tournament_id, events[game_id])
+                   for tournament_id, game_id in rows)
+
+
+def within(transaction, ancestor):
+    """True if transaction is ancestor or one of its nested transactions"""
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@db.event.listens_for(db.session, "after_commit")
+def publish_game_events(session):
+    for _, tournament_id, data in session.info.pop("game_events", ()):
+        broker.publish(tournament_id, data)
+
+
+@db.event.listens_for(db.session, "after_soft_rollback")
+def discard_game_events(session, previous_transaction):
+    """
+    A rollback of the outermost transaction drops all events, one of a
+    savepoint those collected within it
+    """
+    if previous_transaction.parent is None:
+        session.info.pop("game_events", None)
+        return
+    pending = session.info.get("game_events")
+    if pending:
+        pending[:] = [event for event in pending
+                      if not within(event[0], previous_transaction)]
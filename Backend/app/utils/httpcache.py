@@ -0,0 +1,116 @@
+import functools
+import hashlib
+from app import app
+from app.models import Counters
+from app.utils.cache import get_cache
+from app.utils.streaming import wants_ndjson
+from datetime import date
+from flask import request, make_response, Response
+
+# (path, args, ndjson) -> (etag, state, body, mimetype, headers), state is
+# (day, {counter: version}) of the data the body was rendered from
+responses = get_cache("http", ttl=app.config["HTTP_CACHE_TTL"],
+                      maxbytes=app.config["HTTP_CACHE_LOCAL_BYTES"],
+                      sizeof=lambda entry: len(entry[2]) + 512)
+stats = {"hits": 0, "misses": 0, "not_modified": 0, "uncacheable": 0}
+
+
+def is_newer(state, other):
+    """True if state is of the same day and no version is older"""
+    return state[0] == other[0] and all(
+        state[1].get(name, 0) >= version
+        for name, version in other[1].items())
+
+
+def store(key, entry):
+    """
+    Caches an entry unless the cached one is at least as new, e.g. when
+    entry was read from a lagging replica
+    """
+    current = responses.get(key)
+    if current is None or not is_newer(current[1], entry[1]):
+        responses.set(key, entry)
+
+
+def buffered(response, key, etag, state):
+    """Passes a streamed body through and caches it if it's small enough"""
+    body, mimetype = response.response, response.mimetype
+    headers = extra_headers(response)
+
+    def generate():
+        chunks, size = [], 0
+        try:
+            for chunk in body:
+                if chunks is not None:
+                    size += len(chunk)
+                    if size > app.config["HTTP_CACHE_MAX_BODY"]:
+                        chunks = None
+                        stats["uncacheable"] += 1
+                    else:
+                        chunks.append(chunk.encode()
+                                      if isinstance(chunk, str) else chunk)
+                yield chunk
+        finally:
+            # Pops the request context of stream_with_context in order
+            if hasattr(body, "close"):
+                body.close()
+        if chunks is not None:
+            store(key, (etag, state, b"".join(chunks), mimetype,
+                        headers))
+    return generate()
+
+
+def extra_headers(response):
+    return {name: value for name, value in response.headers.items()
+            if name.startswith("X-")}
+
+
+def cached(tables, params=(), max_age=None):
+    """
+    Caches GET responses keyed by path and the query args the view reads
+    (params), other args don't create entries of their own
+    The strong ETag is derived from the version counters of tables, which
+    are bumped on every commit writing to them
+    """
+    names = ["leaderboard" if table == "leaderboard" else f"table:{table}"
+             for table in tables]
+
+    def actual_decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (request.path, tuple(request.args.get(name)
+                                       for name in params), wants_ndjson())
+            # Activity of tournaments depends on the day
+            state = (date.today().isoformat(), Counters.get_many(names))
+            entry = responses.get(key)
+            if entry is not None and is_newer(entry[1], state):
+                # Also served to requests reading from a lagging replica
+                etag = entry[0]
+            else:
+                entry = None
+                etag = hashlib.sha1(repr((key, sorted(state[1].items()),
+                                          state[0])).encode()).hexdigest()
+            age = app.config["HTTP_CACHE_MAX_AGE"] if max_age is None \
+                else max_age
+            if etag in request.if_none_match:
+                stats["not_modified"] += 1
+                response = Response(status=304)
+            elif entry is not None:
+                stats["hits"] += 1
+                _, _, body, mimetype, headers = entry
+                response = Response(body, mimetype=mimetype, headers=headers)
+            else:
+                stats["misses"] += 1
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if response.is_streamed:
+                    response.response = buffered(response, key, etag, state)
+                else:
+                    store(key, (etag, state, response.get_data(),
+                                response.mimetype, extra_headers(response)))
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = f"public, max-age={age}"
+            return response
+        return wrapper
+    return actual_decorator
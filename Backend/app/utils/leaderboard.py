@@ -0,0 +1,80 @@
+import threading
+from app import db
+from app.models import User, Counters
+from app.utils.pagination import encode_cursor, decode_cursor
+from bisect import bisect_right
+
+
+class Leaderboard(object):
+    """
+    In-process snapshot of all rated users sorted by points
+    The snapshot is rebuilt when the 'leaderboard' counter grew, an older
+    version (e.g. read from a lagging replica) keeps the newer snapshot
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (version, entries, keys, positions) is replaced as a whole, the
+        # initial version is older than any so the first request builds it
+        self.snapshot = (-1, [], [], {})
+
+    def build(self, version):
+        rows = db.session.query(User.id, User.username, User.points).filter(
+            User.points.isnot(None)
+        ).order_by(User.points.desc(), User.id.desc()).all()
+        return self.rank(version, rows)
+
+    @staticmethod
+    def rank(version, rows):
+        """Returns the snapshot of (id, username, points) rows, best first"""
+        entries, rank = [], 0
+        for index, (id, username, points) in enumerate(rows):
+            # Equal points share a rank (1, 2, 2, 4)
+            if index == 0 or points != rows[index - 1][2]:
+                rank = index + 1
+            entries.append(dict(id=id, username=username, points=points,
+                                rank=rank))
+        # Ascending sort keys for bisect
+        keys = [(-points, -id) for id, _, points in rows]
+        positions = {entry["id"]: index
+                     for index, entry in enumerate(entries)}
+        return version, entries, keys, positions
+
+    def outdated(self, version):
+        """True if the counter is newer than the snapshot"""
+        return (version or 0) > self.snapshot[0]
+
+    def current(self):
+        """Returns the current snapshot, rebuilds it if it's outdated"""
+        version = Counters.get("leaderboard")
+        if self.outdated(version):
+            with self.lock:
+                if self.outdated(version):
+                    self.snapshot = self.build(version or 0)
+        return self.snapshot
+
+    def page(self, limit=100, cursor=None):
+        """Returns (entries, next_cursor) with the same cursors as paginate"""
+        _, entries, keys, _ = self.current()
+        start = 0
+        if cursor:
+            points, id = decode_cursor(cursor, [int, int])
+            start = bisect_right(keys, (-points, -id))
+        if limit is None:
+            return entries[start:], None
+        page = entries[start:start + limit]
+        if start + limit >= len(entries) or not page:
+            return page, None
+        return page, encode_cursor([page[-1]["points"], page[-1]["id"]])
+
+    def around(self, user_id, neighbours=5):
+        """Returns (entry, neighbours) of a user or (None, []) if unranked"""
+        _, entries, _, positions = self.current()
+        index = positions.get(user_id)
+        if index is None:
+            return None, []
+        return entries[index], entries[max(index - neighbours, 0):
+                                       index + neighbours + 1]
+
+
+leaderboard = Leaderboard()
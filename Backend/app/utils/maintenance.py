@@ -1,15 +1,66 @@
+import logging
+import time
 import app.utils as utils
-from app import app, cron
-from app.models import User
+from app import app, db
+from app.models import User, Role, UserRoles, ScheduledJobs
+from app.utils.rating import build_snapshot, swap_snapshot
+from app.utils.storage import vacuum
+from contextlib import contextmanager
+
+
+@contextmanager
+def phase(name, timings):
+    """Measures the duration of a maintenance phase in seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - start, 3)
+
+
+def assign_top_100():
+    """Gives the 'Top 100' role to exactly the 100 users with most points"""
+    role_id = utils.get_role_id("Top 100")
+    if role_id is None:
+        db.session.add(Role(name="Top 100"))
+        db.session.commit()
+        role_id = utils.get_role_id("Top 100")
+    top_100 = {id for id, in db.session.query(User.id).filter(
+        User.points.isnot(None)).order_by(User.points.desc(), User.id.desc()
+                                          ).limit(100)}
+    holders = {id for id, in db.session.query(UserRoles.user_id
+                                              ).filter_by(role_id=role_id)}
+    if holders - top_100:
+        UserRoles.query.filter(UserRoles.role_id == role_id,
+                               UserRoles.user_id.in_(holders - top_100)
+                               ).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(UserRoles, [
+        dict(user_id=id, role_id=role_id) for id in top_100 - holders])
+    db.session.commit()
 
 
 def maintenance():
-    """maintenance tasks and daily schuedled tasks"""
-    app.maintenance = True
-    [user.calculate_points() for user in User.query.all()]
-    top_100 = User.query.order_by(User.points.desc()).all().limit(100)
-    top_100_role = Role.query.filter_by(name="Top 100").first()
-    [user.add_role(top_100_role) for user in top_100]
-    utils.vacuum_db()
-    app.maintenance = False
-    utils.schuedle_maintenance()
+    """
+    maintenance tasks and daily schuedled tasks
+    Ratings are computed into a snapshot while requests are served as usual,
+    only the swap of the snapshot blocks writes
+    """
+    timings = {}
+    if app.config["RATING_FULL_REBUILD"] or \
+       app.config["RATING_CONSISTENCY_CHECK"]:
+        with phase("snapshot", timings):
+            build_snapshot(full=app.config["RATING_FULL_REBUILD"])
+        with phase("swap", timings):
+            # Shared by all workers, see before_request_hook
+            ScheduledJobs.block_writes("maintenance")
+            try:
+                swap_snapshot()
+            finally:
+                ScheduledJobs.block_writes("maintenance", False)
+    with phase("top_100", timings):
+        assign_top_100()
+    with phase("vacuum", timings):
+        vacuum()
+    logging.info("Maintenance finished " + ", ".join(
+        f"{name}: {duration}s" for name, duration in timings.items()))
+    return timings
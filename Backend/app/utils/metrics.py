@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from app import app, db
+from bisect import bisect_left
+from flask import g, request
+
+# Upper bounds of the histogram buckets
+MILLISECONDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+QUERIES = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram(object):
+    """Thread safe histogram with fixed buckets"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """Upper bound of the bucket containing the q-th percentile"""
+        rank, seen = q / 100 * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def jsonify(self):
+        with self.lock:
+            return {"count": self.count,
+                    "mean": round(self.sum / self.count, 3)
+                    if self.count else 0,
+                    "p50": self.percentile(50),
+                    "p95": self.percentile(95),
+                    "p99": self.percentile(99),
+                    "max": round(self.max, 3),
+                    "buckets": dict(zip([str(bound) for bound in self.bounds]
+                                        + ["+Inf"], self.counts))}
+
+
+class EndpointMetrics(object):
+    """Request duration, DB time and query count of one endpoint"""
+
+    def __init__(self):
+        self.duration = Histogram(MILLISECONDS)
+        self.db_time = Histogram(MILLISECONDS)
+        self.queries = Histogram(QUERIES)
+
+    def jsonify(self):
+        return {"duration_ms": self.duration.jsonify(),
+                "db_time_ms": self.db_time.jsonify(),
+                "queries": self.queries.jsonify()}
+
+
+endpoints = {}
+lock = threading.Lock()
+
+
+def get_endpoint(name):
+    if name not in endpoints:
+        with lock:
+            endpoints.setdefault(name, EndpointMetrics())
+    return endpoints[name]
+
+
+@db.event.listens_for(db.engine, "before_cursor_execute")
+def start_query(connection, cursor, statement, parameters, context,
+                executemany):
+    # On the execution context, a failed statement leaves nothing behind
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+@db.event.listens_for(db.engine, "after_cursor_execute")
+def end_query(connection, cursor, statement, parameters, context,
+              executemany):
+    start = getattr(context, "_query_start", None)
+    elapsed = time.perf_counter() - start if start is not None else 0
+    # Queries of the scheduler and CLI aren't attributed to a request
+    if g and "request_start" in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0
+
+
+@app.after_request
+def record_request(response):
+    """
+    Adds Server-Timing headers and records the request in the histograms
+    Queries while a streamed body is generated are not included
+    """
+    if "request_start" not in g:
+        return response
+    duration = (time.perf_counter() - g.request_start) * 1000
+    db_time = g.db_time * 1000
+    response.headers["Server-Timing"] = \
+        f'db;desc="{g.db_queries} queries";dur={db_time:.2f}, ' \
+        f'app;dur={duration:.2f}'
+    name = request.url_rule.rule if request.url_rule else "<unmatched>"
+    metrics = get_endpoint(f"{request.method} {name}")
+    metrics.duration.observe(duration)
+    metrics.db_time.observe(db_time)
+    metrics.queries.observe(g.db_queries)
+    return response
+
+
+def snapshot():
+    """Metrics of this worker process"""
+    pool = db.engine.pool
+    return {"pid": os.getpid(),
+            "pool": pool.status(),
+            "endpoints": {name: metrics.jsonify()
+                          for name, metrics in sorted(endpoints.items())}}
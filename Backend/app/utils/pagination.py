@@ -0,0 +1,63 @@
+import base64
+import json
+from flask import abort
+
+
+def encode_cursor(values):
+    """Returns an opaque cursor for a list of json serializable values"""
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, types):
+    """
+    Returns the values of a cursor, aborts with 400 if it's invalid or its
+    values aren't of the expected types (one per value)
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(
+            cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        return abort(400)
+    if not isinstance(values, list) or len(values) != len(types):
+        return abort(400)
+    for value, type in zip(values, types):
+        # bool is a subclass of int
+        if not isinstance(value, type) or isinstance(value, bool):
+            return abort(400)
+    return values
+
+
+def after(columns, values, descending=False):
+    """Condition for rows behind (columns) = (values) in the sort order"""
+    column, value = columns[0], values[0]
+    beyond = column < value if descending else column > value
+    if len(columns) == 1:
+        return beyond
+    return beyond | ((column == value) &
+                     after(columns[1:], values[1:], descending))
+
+
+def paginate(query, columns, key, cursor=None, limit=100, descending=False,
+             chunk_size=1000):
+    """
+    Keyset pagination of query ordered by columns
+    key returns the cursor values (same order as columns) of a row
+    Returns (rows, next_cursor), next_cursor is None on the last page
+    Without limit rows are streamed from a server side cursor
+    """
+    if cursor:
+        query = query.filter(after(columns, decode_cursor(
+            cursor, [column.type.python_type for column in columns]),
+            descending))
+    query = query.order_by(*[column.desc() if descending else column
+                             for column in columns])
+    if limit is None:
+        return query.execution_options(stream_results=True
+                                       ).yield_per(chunk_size), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
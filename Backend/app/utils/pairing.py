@@ -0,0 +1,67 @@
+from app import db
+from app.models import User, UserGames, TournamentGames, TournamentPlayers
+
+
+def load_round_data(tournament_id):
+    """
+    Loads participants and previous pairings of a tournament in two queries
+    Returns ([(user_id, points)], {user_id: {user_ids played against}})
+    """
+    players = db.session.query(User.id, User.points).join(
+        TournamentPlayers, TournamentPlayers.user_id == User.id
+    ).filter(TournamentPlayers.tournament_id == tournament_id).all()
+    rows = db.session.query(UserGames.game_id, UserGames.user_id).join(
+        TournamentGames, TournamentGames.game_id == UserGames.game_id
+    ).filter(TournamentGames.tournament_id == tournament_id
+             ).order_by(UserGames.game_id).all()
+    games = {}
+    for game_id, user_id in rows:
+        games.setdefault(game_id, []).append(user_id)
+    played = {}
+    for user_ids in games.values():
+        for user_id in user_ids:
+            played.setdefault(user_id, set()).update(user_ids)
+    return players, played
+
+
+def pair_round(players, played, table_size=4, window=16):
+    """
+    Assigns players to tables of table_size for one round
+    Players are seated by points, each table is filled with the nearest
+    players in the ranking who haven't played against anyone at the table,
+    looking at most window players ahead
+    Returns (tables, byes), byes are the players left without a full table
+    """
+    ranking = [id for id, _ in
+               sorted(players, key=lambda player: (-(player[1] or 0),
+                                                   player[0]))]
+    seated = set()
+    tables = []
+    position = 0
+    while len(ranking) - len(seated) >= table_size:
+        while ranking[position] in seated:
+            position += 1
+        table = [ranking[position]]
+        seated.add(ranking[position])
+        opponents = set(played.get(ranking[position], ()))
+        candidates = []
+        index = position + 1
+        while len(candidates) < window and index < len(ranking):
+            if ranking[index] not in seated:
+                candidates.append(ranking[index])
+            index += 1
+        for candidate in candidates:
+            if len(table) == table_size:
+                break
+            if candidate not in opponents:
+                table.append(candidate)
+                opponents.update(played.get(candidate, ()))
+        # Rematches can't always be avoided, take the closest players then
+        for candidate in candidates:
+            if len(table) == table_size:
+                break
+            if candidate not in table:
+                table.append(candidate)
+        seated.update(table)
+        tables.append(table)
+    return tables, [id for id in ranking if id not in seated]
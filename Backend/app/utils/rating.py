@@ -0,0 +1,114 @@
+import logging
+from app import db
+from app.models import (User, Games, UserGames, GameResults, UserPlacements,
+                        RatingSnapshot, Counters)
+from app.utils.results import ensure_backfilled
+from datetime import date
+
+
+def count_placements(chunk_size=1000):
+    """
+    Counts the placements of every user with one GROUP BY over game_results
+    Only finished games are counted, like the incremental updates do
+    Returns {user_id: {1: int, 2: int, 3: int, 4: int}}
+    """
+    placements = {user_id: {1: 0, 2: 0, 3: 0, 4: 0}
+                  for user_id, in db.session.query(User.id
+                                                   ).yield_per(chunk_size)}
+    rows = db.session.query(
+        GameResults.user_id, GameResults.placement, db.func.count()
+    ).join(UserGames, db.and_(UserGames.game_id == GameResults.game_id,
+                              UserGames.user_id == GameResults.user_id)
+           ).join(Games, Games.id == GameResults.game_id
+                  ).filter(Games.state == 0).group_by(
+        GameResults.user_id, GameResults.placement).yield_per(chunk_size)
+    for user_id, placement, count in rows:
+        if user_id in placements and \
+           UserPlacements.column(placement, user_id) is not None:
+            placements[user_id][placement] += count
+    return placements
+
+
+def build_snapshot(full=False, chunk_size=1000):
+    """
+    Computes ratings into the rating_snapshot shadow table
+    Unless full is set only users which are out of sync are written
+    Returns the ids of all users in the snapshot
+    """
+    # Counting an empty game_results would reset everyone's points
+    ensure_backfilled()
+    empty = {1: 0, 2: 0, 3: 0, 4: 0}
+    # Versions are read before counting, so every game which is finished
+    # while counting leaves a version the swap will not accept
+    stored = {record.user_id: record for record in
+              UserPlacements.query.yield_per(chunk_size)}
+    points = dict(db.session.query(User.id, User.points
+                                   ).yield_per(chunk_size))
+    snapshot = []
+    for user_id, results in count_placements(chunk_size).items():
+        record = stored.get(user_id)
+        rating = User.rate_placements(results)
+        if full or (record.results if record else empty) != results or \
+           points.get(user_id) != rating:
+            snapshot.append(dict(user_id=user_id, points=rating,
+                                 version=record.version if record else 0,
+                                 **{column: results[placement]
+                                    for placement, column
+                                    in UserPlacements.columns.items()}))
+    db.session.query(RatingSnapshot).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(RatingSnapshot, snapshot)
+    db.session.commit()
+    return [record["user_id"] for record in snapshot]
+
+
+def swap_snapshot():
+    """
+    Applies the rating_snapshot table in a single transaction
+    Users rated incrementally since the snapshot was built are skipped
+    Returns the number of users which were updated
+    """
+    snapshot = RatingSnapshot.__table__
+    placements = UserPlacements.__table__
+    users = User.__table__
+    live_version = db.select([placements.c.version]).where(
+        placements.c.user_id == snapshot.c.user_id).as_scalar()
+    valid = db.select([snapshot.c.user_id]).where(
+        snapshot.c.valid == db.true())
+    db.session.execute(snapshot.update().values(
+        valid=db.func.coalesce(live_version, 0) == snapshot.c.version))
+    db.session.execute(users.update().where(users.c.id.in_(valid)).values(
+        points=db.select([snapshot.c.points]).where(
+            snapshot.c.user_id == users.c.id).as_scalar(),
+        last_rated=date.today()))
+    db.session.execute(placements.delete().where(
+        placements.c.user_id.in_(valid)))
+    db.session.execute(placements.insert().from_select(
+        ["user_id", "first", "second", "third", "fourth", "version"],
+        db.select([snapshot.c.user_id, snapshot.c.first, snapshot.c.second,
+                   snapshot.c.third, snapshot.c.fourth,
+                   snapshot.c.version + 1]).where(
+                       snapshot.c.valid == db.true())))
+    swapped = db.session.query(RatingSnapshot).filter_by(valid=True).count()
+    if swapped:
+        Counters.bump("leaderboard")
+    db.session.commit()
+    return swapped
+
+
+def rate_all(chunk_size=1000):
+    """Rebuilds points and placement counts of all users"""
+    build_snapshot(full=True, chunk_size=chunk_size)
+    return swap_snapshot()
+
+
+def check_consistency(chunk_size=1000, repair=True):
+    """
+    Compares the incrementally maintained ratings against a full recount
+    Returns the ids of all users which were out of sync
+    """
+    broken = build_snapshot(chunk_size=chunk_size)
+    if broken:
+        logging.warning(f"Ratings of {len(broken)} users were out of sync")
+    if broken and repair:
+        swap_snapshot()
+    return broken
@@ -0,0 +1,213 @@
+import logging
+import time
+from app import db
+from app.models import (User, Games, UserGames, GameResults, AltRatings,
+                        Counters)
+from app.utils.results import ensure_backfilled
+from collections import namedtuple
+from datetime import date, datetime
+
+# Rows of finished games sorted chronologically, per row: game (index into
+# games), user (index into user_ids) and placement; per game: id and day
+History = namedtuple("History", ["games", "days", "user_ids", "game",
+                                 "user", "placement"])
+
+models = {}
+
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Rating replays require the numpy package")
+    return numpy
+
+
+def model(name):
+    """Registers a rating model, models return a rating per user index"""
+    def actual_decorator(func):
+        models[name] = func
+        return func
+    return actual_decorator
+
+
+def load_history(chunk_size=100000):
+    """
+    Loads the placements of all finished games into arrays in one query
+    Counted like count_placements: only players of the game with a result
+    """
+    np = load_numpy()
+    ensure_backfilled()
+    query = db.session.query(
+        GameResults.game_id, Games.date, GameResults.user_id,
+        GameResults.placement
+    ).join(UserGames, db.and_(UserGames.game_id == GameResults.game_id,
+                              UserGames.user_id == GameResults.user_id)
+           ).join(Games, Games.id == GameResults.game_id
+                  ).filter(Games.state == 0)
+    result = db.session.execute(query.statement.execution_options(
+        stream_results=True))
+    chunks = []
+    # Plain tuples of the DBAPI cursor, numpy parses ISO dates of SQLite
+    while True:
+        rows = result.cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        game_ids, days, user_ids, placements = zip(*rows)
+        chunks.append((np.array(game_ids, dtype=np.int64),
+                       np.array(days, dtype="datetime64[D]"),
+                       np.array(user_ids, dtype=np.int64),
+                       np.array(placements, dtype=np.int64)))
+    result.close()
+    if not chunks:
+        empty = np.array([], dtype=np.int64)
+        return History(empty, empty, empty, empty, empty, empty)
+    game_ids, days, user_ids, placements = [np.concatenate(column)
+                                            for column in zip(*chunks)]
+    days = days.astype(np.int64)
+    # Games without date are replayed first
+    undated = days == np.datetime64("NaT").astype(np.int64)
+    days[undated] = days[~undated].min() if (~undated).any() else 0
+    order = np.lexsort((game_ids, days))
+    game_ids, days = game_ids[order], days[order]
+    user_ids, placements = user_ids[order], placements[order]
+    games, first, game = np.unique(game_ids, return_index=True,
+                                   return_inverse=True)
+    # np.unique sorts by id, renumber the games in chronological order
+    chronological = np.argsort(first)
+    renumber = np.empty_like(chronological)
+    renumber[chronological] = np.arange(len(chronological))
+    users, user = np.unique(user_ids, return_inverse=True)
+    return History(games[chronological], days[first][chronological], users,
+                   renumber[game], user, placements)
+
+
+def placement_counts(history, weights=None):
+    """Returns (users x 4) counts of 1st to 4th places"""
+    np = load_numpy()
+    counts = np.zeros((len(history.user_ids), 4))
+    for placement in range(1, 5):
+        rows = history.placement == placement
+        counts[:, placement - 1] = np.bincount(
+            history.user[rows], minlength=len(history.user_ids),
+            weights=None if weights is None else weights[rows])
+    return counts
+
+
+def rate_counts(counts):
+    """User.rate_placements on arrays of counts"""
+    np = load_numpy()
+    return np.round(counts[:, 3] * 2 - (counts[:, 0] - counts[:, 1] * 0.5
+                                         - counts[:, 2] * 0.5))
+
+
+@model("current")
+def current_model(history):
+    """The formula of User.rate_placements, same points as rate_all"""
+    return rate_counts(placement_counts(history))
+
+
+@model("decay")
+def decay_model(history, half_life=180):
+    """The current formula with placements weighted by their age in days"""
+    np = load_numpy()
+    today = np.datetime64(date.today(), "D").astype(np.int64)
+    age = today - history.days[history.game]
+    weights = np.power(0.5, np.maximum(age, 0) / half_life)
+    return rate_counts(placement_counts(history, weights))
+
+
+def seat_matrix(history, size):
+    """(games x size) matrices of user indices and placements, -1 padded"""
+    np = load_numpy()
+    order = np.argsort(history.game, kind="stable")
+    game = history.game[order]
+    starts = np.searchsorted(game, np.arange(len(history.games)))
+    seat = np.arange(len(game)) - starts[game]
+    users = np.full((len(history.games), size), -1)
+    placements = np.full((len(history.games), size), -1)
+    users[game, seat] = history.user[order]
+    placements[game, seat] = history.placement[order]
+    return users, placements
+
+
+@model("elo")
+def elo_model(history, k=32, initial=1500, batch=100000):
+    """
+    Multiplayer Elo, every game counts as pairwise matches between its
+    players, scores are averaged over the opponents
+    Games of one day are rated together from the ratings of the day before,
+    days with more than batch games are split
+    """
+    np = load_numpy()
+    ratings = np.full(len(history.user_ids), float(initial))
+    if not len(history.games):
+        return ratings
+    size = np.bincount(history.game).max()
+    users, placements = seat_matrix(history, size)
+    other = ~np.eye(size, dtype=bool)[None]
+    bounds = np.flatnonzero(np.diff(history.days)) + 1
+    for first, last in zip(np.concatenate(([0], bounds)),
+                           np.concatenate((bounds, [len(history.games)]))):
+        for start in range(first, last, batch):
+            end = min(start + batch, last)
+            seated = users[start:end] >= 0
+            placed = placements[start:end]
+            # Pairs of two seated, different players
+            pairs = seated[:, :, None] & seated[:, None, :] & other
+            opponents = np.maximum(pairs.sum(axis=2), 1)
+            # 1 for a better placement, 0.5 for a tie
+            actual = (placed[:, :, None] < placed[:, None, :]) + \
+                (placed[:, :, None] == placed[:, None, :]) * 0.5
+            current = np.where(seated, ratings[users[start:end]], 0)
+            expected = 1 / (1 + 10 ** ((current[:, None, :] -
+                                        current[:, :, None]) / 400))
+            delta = k * ((actual - expected) * pairs).sum(axis=2) / opponents
+            np.add.at(ratings, users[start:end][seated], delta[seated])
+    return ratings
+
+
+def replay(name, history=None, **params):
+    """Returns (history, ratings) of a model, ratings per history.user_ids"""
+    if name not in models:
+        raise ValueError(f"Unknown rating model {name}")
+    history = history if history is not None else load_history()
+    start = time.perf_counter()
+    ratings = models[name](history, **params)
+    logging.info(f"Replayed {len(history.games)} games with {name} in "
+                 f"{time.perf_counter() - start:.2f}s")
+    return history, ratings
+
+
+def write_alt_ratings(name, history, ratings, chunk_size=10000):
+    """Replaces the alt_ratings rows of a model"""
+    np = load_numpy()
+    games = np.bincount(history.user, minlength=len(history.user_ids))
+    computed = datetime.utcnow()
+    table = AltRatings.__table__
+    db.session.execute(table.delete().where(table.c.model == name))
+    rows = [dict(model=name, user_id=user_id, rating=rating, games=count,
+                 computed=computed) for user_id, rating, count in zip(
+                     history.user_ids.tolist(), ratings.tolist(),
+                     games.tolist())]
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(table.insert(), rows[start:start + chunk_size])
+    db.session.commit()
+    return len(rows)
+
+
+def backfill_points(history, ratings, chunk_size=10000):
+    """Writes ratings into User.points of every user who played"""
+    table = User.__table__
+    statement = table.update().where(
+        table.c.id == db.bindparam("user_id")).values(
+        points=db.bindparam("rating"), last_rated=date.today())
+    rows = [dict(user_id=user_id, rating=int(round(rating)))
+            for user_id, rating in zip(history.user_ids.tolist(),
+                                       ratings.tolist())]
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(statement, rows[start:start + chunk_size])
+    # Core updates bypass the ORM listener which bumps the leaderboard
+    Counters.bump("leaderboard")
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,52 @@
+from app import app, db
+from app.session import replica_binds
+from app.utils.cache import get_cache
+from app.utils.metrics import start_query, end_query
+from app.utils.storage import listen_connections
+from flask import g, request
+
+# Clients who wrote in the last REPLICA_STICKY_SECONDS
+sticky = get_cache("replica-sticky", ttl=app.config["REPLICA_STICKY_SECONDS"])
+
+
+def listen_replica(engine):
+    """
+    Replica connections are read only and count into the request metrics
+    like the primary's
+    """
+    listen_connections(engine, replica=True)
+    db.event.listen(engine, "before_cursor_execute", start_query)
+    db.event.listen(engine, "after_cursor_execute", end_query)
+
+
+for bind in replica_binds(app.config):
+    listen_replica(db.get_engine(app, bind=bind))
+
+
+def client_key():
+    """
+    The authenticated user, whether it used a password or a token, the
+    address of anonymous clients
+    """
+    user = g.get("user")
+    if user is not None:
+        return ("user", user.id)
+    return ("address", request.remote_addr)
+
+
+def remember_write():
+    if replica_binds(app.config):
+        sticky.set(client_key(), True)
+
+
+def reads_from_replica():
+    """
+    Reads of GET requests of clients who didn't write recently
+    None while the credentials of the request aren't verified yet, the
+    client isn't known
+    """
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.authorization and g.get("user") is None:
+        return None
+    return not sticky.get(client_key(), False)
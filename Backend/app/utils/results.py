@@ -0,0 +1,75 @@
+import logging
+from app import db
+from app.models import Games, GameResults, Counters
+
+# Counter set by a complete backfill, or by the first finished game of a
+# database which had game_results from the start
+BACKFILLED = "game_results_backfilled"
+
+
+def backfill_game_results(batch_size=1000):
+    """
+    Rebuilds game_results from Games.result in batches of batch_size games
+    Every batch is committed on its own, returns the number of rows written
+    """
+    table = GameResults.__table__
+    last_id, written = 0, 0
+    while True:
+        games = db.session.query(Games.id, Games.result).filter(
+            Games.id > last_id).order_by(Games.id).limit(batch_size).all()
+        if not games:
+            Counters.bump(BACKFILLED)
+            db.session.commit()
+            return written
+        last_id = games[-1][0]
+        rows = [row for game_id, result in games
+                for row in GameResults.rows(game_id, result)]
+        db.session.execute(table.delete().where(table.c.game_id.in_(
+            [game_id for game_id, _ in games])))
+        if rows:
+            db.session.execute(table.insert(), rows)
+        db.session.commit()
+        written += len(rows)
+        logging.info(f"Backfilled game_results up to game {last_id}")
+
+
+# Set once game_results is known to be complete, it stays complete
+backfilled = False
+
+
+def missing_results():
+    """Games with a (non-empty) result but no game_results rows"""
+    table = GameResults.__table__
+    return Games.query.filter(
+        Games.result.isnot(None),
+        db.cast(Games.result, db.Text).notin_(["null", "[]"]),
+        ~db.exists().where(table.c.game_id == Games.id))
+
+
+def is_backfilled(exclude_game_id=None):
+    """
+    False if game_results misses games, i.e. the database was upgraded and
+    game_results was never backfilled
+    exclude_game_id is a game being finished, which doesn't count
+    """
+    global backfilled
+    if not backfilled:
+        backfilled = bool(Counters.get(BACKFILLED))
+    # Results of unfinished games are only written when they change, a
+    # database without finished games may still have them from before
+    if not backfilled and not db.session.query(Games.query.filter(
+            Games.state == 0, Games.id != exclude_game_id).exists()
+    ).scalar() and not db.session.query(missing_results().exists()
+                                        ).scalar():
+        # Every game is written to game_results from now on
+        Counters.bump(BACKFILLED)
+        backfilled = True
+    return backfilled
+
+
+def ensure_backfilled(batch_size=1000):
+    """Backfills game_results if it misses games, see is_backfilled"""
+    if is_backfilled():
+        return
+    logging.warning("game_results wasn't backfilled, backfilling it")
+    backfill_game_results(batch_size)
@@ -0,0 +1,127 @@
+import logging
+import os
+import socket
+import time
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from app import app, db, cron
+from app.models import ScheduledJobs
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, there's no lock file and every process is the leader
+    fcntl = None
+
+# Application wide key of the PostgreSQL advisory lock
+ADVISORY_LOCK_KEY = 0x50656e7461
+owner = f"{socket.gethostname()}:{os.getpid()}"
+# Connection or file holding the lock while this process is the leader
+leadership = None
+
+
+def try_advisory_lock():
+    """Returns a connection holding the advisory lock or None"""
+    connection = db.engine.connect()
+    if not connection.scalar(db.text("SELECT pg_try_advisory_lock(:key)"),
+                             key=ADVISORY_LOCK_KEY):
+        connection.close()
+        return None
+    # The lock lives as long as the connection, keep it out of the pool
+    connection.detach()
+    return connection
+
+
+def try_file_lock(path):
+    """Returns the locked lock file or None"""
+    lock = open(path, "a")
+    if fcntl is None:
+        return lock
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+def holds_lock():
+    """Checks the connection of the advisory lock is still alive"""
+    if db.engine.dialect.name != "postgresql":
+        return True
+    try:
+        leadership.scalar("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+
+def elect():
+    """
+    Tries to become the leader, the leader runs the maintenance job
+    Runs in every process, the leader checks it still holds its lock
+    """
+    global leadership
+    if leadership is not None:
+        if holds_lock():
+            return
+        logging.warning(f"Scheduler {owner} lost its lock, stepping down")
+        cron.remove_jobstore("shared")
+        leadership = None
+    if db.engine.dialect.name == "postgresql":
+        leadership = try_advisory_lock()
+    else:
+        leadership = try_file_lock(app.config["SCHEDULER_LOCK"])
+    if leadership is None:
+        return
+    logging.info(f"Scheduler {owner} is the leader")
+    cron.add_jobstore(SQLAlchemyJobStore(engine=db.engine), "shared")
+    # The job and its next run time are persisted, a run missed while no
+    # process was the leader is caught up by the next leader
+    if cron.get_job("maintenance", jobstore="shared") is None:
+        schuedle_maintenance()
+
+
+def schuedle_maintenance():
+    """Schuedles the daily maintenance in the shared job store"""
+    return cron.add_job(
+        run_maintenance, "cron", hour=0, id="maintenance", jobstore="shared",
+        replace_existing=True, coalesce=True,
+        misfire_grace_time=app.config["SCHEDULER_MISFIRE_GRACE"])
+
+
+def run_maintenance():
+    """Runs maintenance and records the run in scheduled_jobs"""
+    from app.utils.maintenance import maintenance
+    ScheduledJobs.started("maintenance", owner)
+    start = time.perf_counter()
+    try:
+        timings = maintenance()
+    except Exception:
+        ScheduledJobs.finished("maintenance", "failed",
+                               time.perf_counter() - start)
+        raise
+    else:
+        ScheduledJobs.finished("maintenance", "ok",
+                               time.perf_counter() - start, timings)
+    finally:
+        db.session.remove()
+
+
+def from_cli():
+    """True in processes of flask CLI commands (flask sets the variable)"""
+    return os.environ.get("FLASK_RUN_FROM_CLI") == "true"
+
+
+def start_scheduler():
+    """
+    Starts the scheduler according to SCHEDULER ('leader' or 'off')
+    flask CLI commands (imports, replays, backfills, ...) never start it, so
+    they can't become the leader and run maintenance alongside
+    """
+    if app.config["SCHEDULER"] == "off" or from_cli():
+        return
+    cron.start()
+    cron.add_job(elect, "interval",
+                 seconds=app.config["SCHEDULER_ELECTION_INTERVAL"],
+                 next_run_time=datetime.now())
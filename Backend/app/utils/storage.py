@@ -0,0 +1,153 @@
+import functools
+import logging
+import time
+from app import app, db
+from flask import has_request_context
+
+# Values of PRAGMA auto_vacuum
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def set_pragmas(dbapi_connection, connection_record, dialect,
+                replica=False):
+    """
+    Pragmas of every new SQLite connection, readers don't block the writer
+    in WAL mode and writers wait SQLITE_BUSY_TIMEOUT instead of failing
+    auto_vacuum only applies to new databases, see vacuum(full=True)
+    Replicas are only read, their files aren't written by this app
+    """
+    if dialect != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    if replica:
+        cursor.execute("PRAGMA query_only=ON")
+    else:
+        # Before anything writes the header of a new file
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable in WAL mode except for the last commits on
+        # power loss
+        cursor.execute("PRAGMA synchronous="
+                       f"{app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute("PRAGMA busy_timeout="
+                   f"{app.config['SQLITE_BUSY_TIMEOUT']}")
+    cursor.close()
+
+
+def set_statement_timeout(dbapi_connection, connection_record,
+                          connection_proxy, dialect):
+    """
+    PostgreSQL connections of requests get DB_STATEMENT_TIMEOUT, those of
+    the scheduler and CLI commands (maintenance, replays, imports) none
+    The SET is only sent when a pooled connection switches between both
+    """
+    if dialect != "postgresql":
+        return
+    timeout = app.config["DB_STATEMENT_TIMEOUT"] \
+        if has_request_context() else 0
+    if connection_record.info.get("statement_timeout") == timeout:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET statement_timeout = {int(timeout)}")
+    cursor.close()
+    # Outside of the transaction, a rollback would reset it
+    dbapi_connection.commit()
+    connection_record.info["statement_timeout"] = timeout
+
+
+def listen_connections(engine, replica=False):
+    """Registers the pragmas and timeouts of the connections of an engine"""
+    dialect = engine.dialect.name
+    db.event.listen(engine, "connect", functools.partial(
+        set_pragmas, dialect=dialect, replica=replica))
+    db.event.listen(engine, "checkout", functools.partial(
+        set_statement_timeout, dialect=dialect))
+
+
+listen_connections(db.engine)
+
+
+def database_size(connection):
+    """Size of the database in bytes, for SQLite without the WAL file"""
+    if connection.dialect.name == "sqlite":
+        return connection.execute("PRAGMA page_count").scalar() * \
+            connection.execute("PRAGMA page_size").scalar()
+    if connection.dialect.name == "postgresql":
+        return connection.execute(
+            "SELECT pg_database_size(current_database())").scalar()
+    return None
+
+
+def vacuum_sqlite(connection, report, full=False):
+    """
+    Frees at most VACUUM_MAX_PAGES pages in steps of VACUUM_STEP pages,
+    every step is a short write transaction of its own
+    full rewrites the whole file with VACUUM, which locks the database and
+    is only needed once to switch an existing file to auto_vacuum
+    """
+    mode = connection.execute("PRAGMA auto_vacuum").scalar()
+    report["auto_vacuum"] = AUTO_VACUUM_MODES.get(mode, mode)
+    report["free_pages"] = connection.execute(
+        "PRAGMA freelist_count").scalar()
+    if full:
+        connection.execute("VACUUM")
+        report["auto_vacuum"] = AUTO_VACUUM_MODES.get(connection.execute(
+            "PRAGMA auto_vacuum").scalar())
+    elif mode != 2:
+        logging.warning("SQLite auto_vacuum is not incremental, free pages "
+                        "are kept until 'flask vacuum --full' runs once")
+    else:
+        step = app.config["VACUUM_STEP"]
+        remaining = min(report["free_pages"], app.config["VACUUM_MAX_PAGES"])
+        cursor = connection.connection.cursor()
+        while remaining > 0:
+            # execute only runs the first step (one page) of the pragma,
+            # executescript runs it to completion
+            cursor.executescript(
+                f"PRAGMA incremental_vacuum({min(step, remaining)});")
+            remaining -= step
+        cursor.close()
+    # Statistics of a sample of rows per index, optimize only analyzes
+    # tables whose statistics are outdated
+    connection.execute("PRAGMA analysis_limit=1000")
+    connection.execute("ANALYZE")
+    connection.execute("PRAGMA optimize")
+
+
+def vacuum_postgresql(connection, report):
+    """VACUUM (ANALYZE) of VACUUM_TABLES or all tables of the app"""
+    tables = app.config["VACUUM_TABLES"] or sorted(db.metadata.tables)
+    # Large tables take longer than the DB_STATEMENT_TIMEOUT of requests
+    connection.execute("SET statement_timeout = 0")
+    report["tables"] = {}
+    for table in tables:
+        start = time.perf_counter()
+        connection.execute(f'VACUUM (ANALYZE) "{table}"')
+        report["tables"][table] = round(time.perf_counter() - start, 3)
+
+
+def vacuum(full=False):
+    """
+    Returns database, size before and after in bytes and duration in
+    seconds of the storage maintenance of the configured database
+    """
+    start = time.perf_counter()
+    connection = db.engine.connect()
+    # VACUUM can't run inside a transaction, pysqlite starts none for
+    # pragmas and VACUUM and doesn't know AUTOCOMMIT
+    if connection.dialect.name == "postgresql":
+        connection = connection.execution_options(
+            isolation_level="AUTOCOMMIT")
+    with connection:
+        report = {"database": connection.dialect.name,
+                  "size_before": database_size(connection)}
+        if connection.dialect.name == "sqlite":
+            vacuum_sqlite(connection, report, full)
+        elif connection.dialect.name == "postgresql":
+            vacuum_postgresql(connection, report)
+        report["size_after"] = database_size(connection)
+    report["duration"] = round(time.perf_counter() - start, 3)
+    logging.info("Storage maintenance " + ", ".join(
+        f"{key}: {value}" for key, value in report.items()
+        if key != "tables"))
+    return report
@@ -0,0 +1,46 @@
+import json
+from flask import Response, request, stream_with_context
+
+# Compact C encoder, every row is serialized exactly once
+encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def wants_ndjson():
+    return request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]
+    ) == "application/x-ndjson"
+
+
+def generate_array(rows, serialize):
+    yield "["
+    first = True
+    for row in rows:
+        if first:
+            first = False
+            yield encode(serialize(row))
+        else:
+            yield "," + encode(serialize(row))
+    yield "]\n"
+
+
+def generate_ndjson(rows, serialize):
+    for row in rows:
+        yield encode(serialize(row)) + "\n"
+
+
+def stream_response(rows, serialize=lambda row: row, next_cursor=None):
+    """
+    Streams rows as json array or as NDJSON if the client accepts it
+    rows can be any iterable, e.g. a query using yield_per
+    The next cursor is send as X-Next-Cursor header
+    """
+    if wants_ndjson():
+        response = Response(stream_with_context(
+            generate_ndjson(rows, serialize)),
+            mimetype="application/x-ndjson")
+    else:
+        response = Response(stream_with_context(
+            generate_array(rows, serialize)), mimetype="application/json")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
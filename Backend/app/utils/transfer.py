@@ -0,0 +1,286 @@
+import csv
+import io
+import json
+import logging
+import threading
+from app import app, db
+from app.models import (Tournaments, TournamentPlayers, Games, matchgames,
+                        TournamentGames, UserGames, GameResults)
+from app.utils.rating import check_consistency
+from collections import OrderedDict
+from datetime import date, datetime
+
+# Tables in the order they have to be imported in
+TABLES = OrderedDict((model.__tablename__, model.__table__) for model in [
+    Tournaments, TournamentPlayers, Games, matchgames, TournamentGames,
+    UserGames])
+FORMATS = ("ndjson", "csv")
+# NULL in CSV exports, values starting with a backslash get another one
+CSV_NULL = "\\N"
+
+
+class PartialImport(Exception):
+    """An import failed, counts are the rows of the chunks committed before"""
+
+    def __init__(self, error, counts):
+        super().__init__(str(error))
+        self.error = error
+        self.counts = counts
+
+
+def get_table(name):
+    if name not in TABLES:
+        raise ValueError(f"Unknown table {name}, use one of "
+                         f"{', '.join(TABLES)}")
+    return TABLES[name]
+
+
+def to_json(column, value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def to_csv(column, value):
+    if value is None:
+        return CSV_NULL
+    if isinstance(value, str) and value.startswith("\\"):
+        return "\\" + value
+    if isinstance(column.type, db.JSON):
+        return json.dumps(value, separators=(",", ":"))
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return to_json(column, value)
+
+
+def parse(column, value, from_csv=False):
+    """
+    Converts an exported value back to the column's python type
+    Empty CSV values of columns other than strings are NULL too
+    """
+    if from_csv:
+        if value == CSV_NULL or (value == "" and
+                                 not isinstance(column.type, db.String)):
+            return None
+        if value.startswith("\\"):
+            value = value[1:]
+    if value is None:
+        return None
+    if isinstance(column.type, db.JSON):
+        return json.loads(value) if from_csv else value
+    if isinstance(column.type, db.Boolean):
+        return value in ("true", "1", True, 1) if from_csv else bool(value)
+    if isinstance(column.type, db.DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, db.Date):
+        return date.fromisoformat(value)
+    if isinstance(column.type, (db.Integer, db.Float)) and from_csv:
+        return column.type.python_type(value)
+    return value
+
+
+def select_chunks(table, chunk_size=5000):
+    """Yields chunks of rows read through a server side cursor"""
+    result = db.session.execute(table.select().order_by(
+        *table.primary_key.columns).execution_options(stream_results=True))
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        result.close()
+
+
+def export_table(name, format="ndjson", tagged=False):
+    """
+    Yields an export of a table as lines of NDJSON or CSV with header
+    tagged adds the table name to every NDJSON record
+    """
+    table = get_table(name)
+    columns = list(table.columns)
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow([column.name for column in columns])
+        for rows in select_chunks(table):
+            writer.writerows([to_csv(column, value) for column, value
+                              in zip(columns, row)] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+    tag = {"table": name} if tagged else {}
+    for rows in select_chunks(table):
+        yield "".join(json.dumps(dict(tag, **{
+            column.name: to_json(column, value)
+            for column, value in zip(columns, row)}),
+            separators=(",", ":")) + "\n" for row in rows)
+
+
+def export_all():
+    """Yields all tables as one NDJSON stream in import order"""
+    for name in TABLES:
+        yield from export_table(name, tagged=True)
+
+
+def read_records(lines, format="ndjson", name=None):
+    """Yields (table name, row dict) of NDJSON or CSV lines"""
+    if format == "csv":
+        table = get_table(name)
+        for record in csv.DictReader(lines):
+            yield name, {column.name: parse(column, record[column.name],
+                                            from_csv=True)
+                         for column in table.columns
+                         if column.name in record}
+        return
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        table = get_table(record.pop("table", name))
+        yield table.name, {column.name: parse(column, record[column.name])
+                           for column in table.columns
+                           if column.name in record}
+
+
+def copy_text(value):
+    """Value in PostgreSQL's COPY text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, separators=(",", ":"))
+    elif isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace(
+        "\n", "\\n").replace("\r", "\\r")
+
+
+def group_by_columns(table, rows):
+    """
+    Yields (column names, rows) of rows with the same keys, in the table's
+    column order, omitted columns keep their defaults
+    """
+    groups = OrderedDict()
+    for row in rows:
+        names = tuple(column.name for column in table.columns
+                      if column.name in row)
+        groups.setdefault(names, []).append(row)
+    yield from groups.items()
+
+
+def insert_chunk(table, rows):
+    """Inserts rows, which may have different keys, in groups"""
+    for names, group in group_by_columns(table, rows):
+        insert_rows(table, names, group)
+
+
+def insert_rows(table, names, rows):
+    """COPY on PostgreSQL, executemany everywhere else"""
+    connection = db.session.connection()
+    if connection.dialect.name != "postgresql":
+        connection.execute(table.insert(), rows)
+        return
+    data = io.StringIO("".join("\t".join(copy_text(row.get(name))
+                                         for name in names) + "\n"
+                               for row in rows))
+    cursor = connection.connection.cursor()
+    columns = ", ".join(f'"{name}"' for name in names)
+    cursor.copy_expert(f'COPY "{table.name}" ({columns}) FROM STDIN', data)
+    # COPY bypasses after_execute, the table's version counter is still due
+    connection.info.setdefault("written_tables", set()).add(table.name)
+
+
+def sync_sequence(table):
+    """PostgreSQL sequences don't advance for explicit ids"""
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', "
+            f"'id'), (SELECT max(id) FROM \"{table.name}\"))"))
+
+
+def sync_sequences(names):
+    for name in names:
+        sync_sequence(TABLES[name])
+    db.session.commit()
+
+
+def fill_end_date(row):
+    """Core inserts bypass the set_end_date listener of Tournaments"""
+    if row.get("end_date") is None:
+        row["end_date"] = Tournaments.end_date_of(row.get("date"),
+                                                  row.get("duration"))
+
+
+def import_records(records, chunk_size=5000):
+    """
+    Inserts (table name, row) records in chunks, each chunk is committed
+    game_results are written for imported games, the ratings of their
+    players have to be repaired afterwards, see repair_ratings
+    Returns {table name: rows imported}, raises PartialImport with the rows
+    committed before an error
+    """
+    chunks, counts, committed = OrderedDict(), OrderedDict(), OrderedDict()
+
+    def flush():
+        # Parents first, e.g. games before the tournament_games pointing
+        # to them
+        for name in sorted(chunks, key=list(TABLES).index):
+            insert_chunk(TABLES[name], chunks[name])
+            if name == Games.__tablename__:
+                insert_chunk(GameResults.__table__, [
+                    result for row in chunks[name]
+                    for result in GameResults.rows(row["id"],
+                                                   row.get("result"))])
+        db.session.commit()
+        for name, chunk in chunks.items():
+            committed[name] = committed.get(name, 0) + len(chunk)
+        chunks.clear()
+
+    try:
+        for name, row in records:
+            if name == Tournaments.__tablename__:
+                fill_end_date(row)
+            chunk = chunks.setdefault(name, [])
+            chunk.append(row)
+            counts[name] = counts.get(name, 0) + 1
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+    except Exception as error:
+        db.session.rollback()
+        try:
+            # Ids of later inserts mustn't collide with the committed rows
+            sync_sequences(committed)
+        except Exception:
+            db.session.rollback()
+            logging.exception("Syncing sequences after an import failed")
+        raise PartialImport(error, committed) from error
+    sync_sequences(counts)
+    return counts
+
+
+def repair_ratings():
+    """Repairs the ratings of all users after games were imported"""
+    logging.info("Repairing ratings after an import")
+    return check_consistency()
+
+
+def repair_ratings_later():
+    """
+    Runs repair_ratings in a thread of its own, outside of the request and
+    its statement timeout, the nightly maintenance repairs them otherwise
+    """
+    def run():
+        with app.app_context():
+            try:
+                repair_ratings()
+            except Exception:
+                logging.exception("Repairing ratings after an import failed")
+            finally:
+                db.session.remove()
+    thread = threading.Thread(target=run, name="repair-ratings", daemon=True)
+    thread.start()
+    return thread
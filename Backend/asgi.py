@@ -0,0 +1,374 @@
+"""
+Optional read only ASGI tier for the endpoints clients poll during events
+    GET /api/tournaments/ongoing
+    GET /api/tournament/<id>/games
+    GET /api/user/leaderboard
+    GET /api/user/<id>/rank
+Responses match the Flask endpoints, queries are built from the models'
+tables and run with aiosqlite or asyncpg (pip install uvicorn aiosqlite
+asyncpg), writes and maintenance stay with the Flask workers
+Run from the Backend folder: uvicorn asgi:application
+"""
+import asyncio
+import json
+import os
+import re
+from datetime import date
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+# The Flask workers run the scheduler, this process only reads
+os.environ.setdefault("SCHEDULER", "off")
+
+from app import app, db
+from app.models import (User, Tournaments, TournamentPlayers,
+                        TournamentGames, Games, Counters)
+from app.utils.leaderboard import Leaderboard
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.streaming import encode, generate_array, generate_ndjson
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.exceptions import BadRequest, HTTPException
+from werkzeug.http import parse_accept_header
+
+
+class SQLiteDatabase(object):
+    """Pool of aiosqlite connections"""
+    dialect = sqlite.dialect(paramstyle="qmark")
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self.connections = asyncio.Queue()
+
+    async def connect(self):
+        import aiosqlite
+        for _ in range(self.size):
+            connection = await aiosqlite.connect(self.path)
+            await connection.execute("PRAGMA query_only=1")
+            self.connections.put_nowait(connection)
+
+    async def close(self):
+        while not self.connections.empty():
+            await self.connections.get_nowait().close()
+
+    async def fetch(self, sql, params):
+        # SQLite stores dates as ISO strings
+        params = [param.isoformat() if isinstance(param, date) else param
+                  for param in params]
+        connection = await self.connections.get()
+        try:
+            async with connection.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+        finally:
+            self.connections.put_nowait(connection)
+
+
+class PostgresDatabase(object):
+    """asyncpg pool sized like the Flask engine's pool"""
+    dialect = postgresql.dialect(paramstyle="format")
+
+    def __init__(self, dsn, size=5, timeout=0):
+        self.dsn = dsn
+        self.size = size
+        self.timeout = timeout
+        self.pool = None
+
+    async def connect(self):
+        import asyncpg
+        settings = {"default_transaction_read_only": "on"}
+        if self.timeout:
+            settings["statement_timeout"] = str(self.timeout)
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=1, max_size=self.size,
+            server_settings=settings)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def fetch(self, sql, params):
+        return await self.pool.fetch(sql, *params)
+
+
+def get_database(config):
+    uri = config["SQLALCHEMY_DATABASE_URI"]
+    if uri.startswith("sqlite:///"):
+        return SQLiteDatabase(uri[len("sqlite:///"):])
+    if uri.startswith("postgres"):
+        dsn = re.sub(r"^postgres(ql)?(\+\w+)?://", "postgresql://", uri)
+        return PostgresDatabase(
+            dsn, size=config["DB_POOL_SIZE"] + config["DB_MAX_OVERFLOW"],
+            timeout=config["DB_STATEMENT_TIMEOUT"])
+    raise ValueError(f"The ASGI tier doesn't support {uri}")
+
+
+def ongoing_statement(by_maintainer):
+    """Same rows as Tournaments.with_details(Tournaments.active_query())"""
+    tournaments, users = Tournaments.__table__, User.__table__
+    participants = db.select([db.func.count(TournamentPlayers.id)]).where(
+        TournamentPlayers.tournament_id == tournaments.c.id
+    ).correlate(tournaments).as_scalar()
+    statement = db.select([
+        tournaments.c.id, tournaments.c.name, tournaments.c.date,
+        tournaments.c.duration, tournaments.c.maintainer_id, users.c.username,
+        participants
+    ]).select_from(tournaments.outerjoin(
+        users, users.c.id == tournaments.c.maintainer_id)).where(
+        tournaments.c.end_date >= db.bindparam("today"))
+    if by_maintainer:
+        statement = statement.where(
+            tournaments.c.maintainer_id == db.bindparam("maintainer_id"))
+    return statement.order_by(tournaments.c.end_date).limit(
+        db.bindparam("limit"))
+
+
+def games_statement(after, limited):
+    """Games of a tournament by id like paginate(tournament.games)"""
+    games, links = Games.__table__, TournamentGames.__table__
+    statement = db.select([
+        games.c.id, games.c.result, games.c.type, games.c.date, games.c.state
+    ]).select_from(games.join(links, links.c.game_id == games.c.id)).where(
+        links.c.tournament_id == db.bindparam("tournament_id"))
+    if after:
+        statement = statement.where(games.c.id > db.bindparam("after"))
+    statement = statement.order_by(games.c.id)
+    if limited:
+        statement = statement.limit(db.bindparam("limit"))
+    return statement
+
+
+STATEMENTS = {
+    "ongoing": ongoing_statement,
+    "games": games_statement,
+    "tournament": lambda: db.select([Tournaments.__table__.c.id]).where(
+        Tournaments.__table__.c.id == db.bindparam("id")),
+    "leaderboard_version": lambda: db.select([
+        Counters.__table__.c.value]).where(
+        Counters.__table__.c.name == "leaderboard"),
+    "leaderboard": lambda: db.select([
+        User.__table__.c.id, User.__table__.c.username,
+        User.__table__.c.points]).where(
+        User.__table__.c.points.isnot(None)).order_by(
+        User.__table__.c.points.desc(), User.__table__.c.id.desc()),
+}
+
+
+@lru_cache(maxsize=None)
+def prepare(dialect, name, *variant):
+    """Compiles a statement once, returns (sql, parameter names, defaults)"""
+    compiled = STATEMENTS[name](*variant).compile(dialect=dialect)
+    sql, names = str(compiled), list(compiled.positiontup)
+    if dialect.name == "postgresql":
+        numbers = iter(range(1, len(names) + 1))
+        sql = re.sub(r"%(s|%)", lambda match: "%" if match.group(1) == "%"
+                     else f"${next(numbers)}", sql)
+    # Literal values like 'leaderboard' are bound too
+    return sql, names, compiled.params
+
+
+async def fetch(name, *variant, **params):
+    sql, names, defaults = prepare(database.dialect, name, *variant)
+    values = dict(defaults, **params)
+    return await database.fetch(sql, [values[key] for key in names])
+
+
+def as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def as_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def tournament_details(row):
+    """Serializes rows like Tournaments.jsonify, ongoing ones are active"""
+    id, name, start, duration, maintainer_id, username, participants = row
+    return dict(name=name, date=as_date(start).strftime("%m.%d.%Y"),
+                duration=duration, maintainer_id=maintainer_id,
+                maintainer_username=username, id=id,
+                participants=participants, active=True)
+
+
+def game_details(row):
+    """Serializes rows like Games.jsonify"""
+    id, result, type, start, state = row
+    result = as_json(result) or []
+    return dict(id=id, result=result, players=len(result), type=bool(type),
+                date=as_date(start).strftime("%d.%m.%Y"),
+                state=Games.STATES[state])
+
+
+class AsyncLeaderboard(Leaderboard):
+    """Leaderboard snapshot refreshed with the async driver"""
+
+    def __init__(self):
+        super().__init__()
+        self.refreshing = asyncio.Lock()
+
+    async def refresh(self):
+        rows = await fetch("leaderboard_version")
+        version = rows[0][0] if rows else 0
+        if self.outdated(version):
+            async with self.refreshing:
+                if self.outdated(version):
+                    rows = await fetch("leaderboard")
+                    self.snapshot = self.rank(version, [tuple(row)
+                                                        for row in rows])
+
+    def current(self):
+        return self.snapshot
+
+
+database = get_database(app.config)
+leaderboard = AsyncLeaderboard()
+
+
+class Request(object):
+
+    def __init__(self, scope):
+        self.path = scope["path"]
+        self.args = {key: values[0] for key, values in parse_qs(
+            scope["query_string"].decode("latin-1")).items()}
+        self.headers = {key.decode("latin-1").lower(): value.decode("latin-1")
+                        for key, value in scope["headers"]}
+
+    def get_int(self, name, default=None):
+        try:
+            return int(self.args[name])
+        except (KeyError, ValueError):
+            return default
+
+    def get_limit(self, default, all=True):
+        """Like routes.get_limit, limit=0 requests all records"""
+        limit = self.get_int("limit", default)
+        if limit is not None and limit < 0:
+            raise BadRequest()
+        return None if limit == 0 and all else limit
+
+    def wants_ndjson(self):
+        return parse_accept_header(self.headers.get("accept"), MIMEAccept
+                                   ).best_match(["application/json",
+                                                 "application/x-ndjson"]
+                                                ) == "application/x-ndjson"
+
+
+async def ongoing_tournaments(request):
+    maintainer_id = request.get_int("maintainer_id")
+    rows = await fetch("ongoing", maintainer_id is not None,
+                       today=date.today(),
+                       limit=request.get_limit(10, all=False),
+                       maintainer_id=maintainer_id)
+    return [tournament_details(row) for row in rows], None
+
+
+async def tournament_games(request, id):
+    if not await fetch("tournament", id=id):
+        raise NotFound()
+    limit = request.get_limit(None)
+    cursor = request.args.get("cursor")
+    after = decode_cursor(cursor, [int])[0] if cursor else None
+    rows = await fetch("games", after is not None, limit is not None,
+                       tournament_id=id, after=after,
+                       limit=None if limit is None else limit + 1)
+    games = [game_details(row) for row in rows]
+    if limit is None or len(games) <= limit:
+        return games, None
+    return games[:limit], encode_cursor([games[limit - 1]["id"]])
+
+
+async def get_leaderboard(request):
+    await leaderboard.refresh()
+    return leaderboard.page(limit=request.get_limit(100),
+                            cursor=request.args.get("cursor"))
+
+
+async def get_rank(request, id):
+    await leaderboard.refresh()
+    entry, entries = leaderboard.around(
+        id, neighbours=request.get_int("neighbours", 5))
+    if entry is None:
+        raise NotFound()
+    return {"rank": entry["rank"], "user": entry, "neighbours": entries}, None
+
+
+ROUTES = [
+    (re.compile(r"^/api/tournaments/ongoing$"), ongoing_tournaments, False),
+    (re.compile(r"^/api/tournament/(\d+)/games$"), tournament_games, True),
+    (re.compile(r"^/api/user/leaderboard$"), get_leaderboard, True),
+    (re.compile(r"^/api/user/(\d+)/rank$"), get_rank, False),
+]
+
+
+class NotFound(Exception):
+    pass
+
+
+async def send_json(send, status, body, headers=()):
+    body = body.encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]
+                + list(headers)})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_rows(send, request, rows, next_cursor):
+    """Sends rows like stream_response, in chunks of about 64 KB"""
+    headers = []
+    if next_cursor is not None:
+        headers.append((b"x-next-cursor", next_cursor.encode()))
+    if request.wants_ndjson():
+        mimetype, chunks = b"application/x-ndjson", generate_ndjson(
+            rows, lambda row: row)
+    else:
+        mimetype, chunks = b"application/json", generate_array(
+            rows, lambda row: row)
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", mimetype)] + headers})
+    buffer, size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= 65536:
+            await send({"type": "http.response.body",
+                        "body": "".join(buffer).encode(), "more_body": True})
+            buffer, size = [], 0
+    await send({"type": "http.response.body", "body": "".join(buffer).encode()})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await database.connect()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await database.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["method"] not in ("GET", "HEAD"):
+        return await send_json(send, 405,
+                               encode({"error": "Method not allowed"}))
+    request = Request(scope)
+    for pattern, handler, is_list in ROUTES:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        try:
+            result, next_cursor = await handler(
+                request, *[int(group) for group in match.groups()])
+        except NotFound:
+            return await send_json(send, 404, encode({"error": "Not found"}))
+        except HTTPException as e:
+            return await send_json(send, e.code, encode({"error": e.name}))
+        if is_list:
+            return await send_rows(send, request, result, next_cursor)
+        return await send_json(send, 200, encode(result) + "\n")
+    return await send_json(send, 404, encode({"error": "Not found"}))
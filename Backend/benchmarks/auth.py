@@ -0,0 +1,46 @@
+# Micro benchmark for the per request authentication overhead
+# Run from the Backend folder: python -m benchmarks.auth [requests]
+import sys
+import time
+from app import app, db
+from app.models import User
+from app.routes import verify_password
+from app.utils import auth
+
+
+def timed(username_or_token, password, requests):
+    """Returns the average duration of verify_password in ms"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        with app.test_request_context():
+            assert verify_password(username_or_token, password)
+            db.session.remove()
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main(requests=1000):
+    user = User.query.filter_by(username="benchmark").first()
+    if user is None:
+        user = User(username="benchmark")
+        user.hash_password("benchmark")
+        db.session.add(user)
+        db.session.commit()
+    _, token = user.generate_auth_token()
+    db.session.remove()
+    ttl = app.config["AUTH_CACHE_TTL"] or 60
+    for name, credentials in [("token", (token.decode("ascii"), "")),
+                              ("password", ("benchmark", "benchmark"))]:
+        # Password logins without cache are slow on purpose
+        count = requests if name == "token" else max(requests // 50, 1)
+        auth.users.ttl = auth.passwords.ttl = 0
+        uncached = timed(*credentials, count)
+        auth.users.ttl = auth.passwords.ttl = ttl
+        auth.users.clear()
+        auth.passwords.clear()
+        cached = timed(*credentials, requests)
+        print(f"{name:>8}: {uncached:.3f} ms uncached, "
+              f"{cached:.3f} ms cached per request")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,188 @@
+# Benchmark of the read endpoints and maintenance through the test client
+# Fill the database with benchmarks.generate first, then run from the
+# Backend folder:
+#   python -m benchmarks.endpoints [--requests 50] [--output run.json]
+#                                  [--baseline old.json] [--cached]
+# Runs are comparable: --baseline prints the change against a saved run
+import argparse
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+os.environ.setdefault("SCHEDULER", "off")
+
+from app import app, db
+from app.models import User, Tournaments, TournamentGames
+from app.session import replica_binds
+from app.utils import httpcache
+from app.utils.maintenance import maintenance
+
+# Slower by more than this factor (and 1 ms) counts as a regression
+TOLERANCE = 1.2
+
+
+def endpoints():
+    """(name, path) of the benchmarked requests for the loaded data"""
+    user_id = db.session.query(User.id).filter(User.points.isnot(None)
+                                               ).order_by(User.id).first()[0]
+    tournament_id = db.session.query(TournamentGames.tournament_id).group_by(
+        TournamentGames.tournament_id).order_by(
+        db.func.count().desc()).first()[0]
+    return [
+        ("leaderboard", "/api/user/leaderboard?limit=100"),
+        ("leaderboard all", "/api/user/leaderboard?limit=0"),
+        ("rank", f"/api/user/{user_id}/rank"),
+        ("user results", f"/api/user/{user_id}/results?limit=100"),
+        ("user list", "/api/user/list?limit=100"),
+        ("ongoing", "/api/tournaments/ongoing"),
+        ("tournament list", "/api/tournaments/list?limit=100"),
+        ("tournament info", f"/api/tournaments/{tournament_id}/info"),
+        ("tournament games",
+         f"/api/tournament/{tournament_id}/games?limit=100"),
+    ]
+
+
+def functions():
+    """(name, callable) of benchmarked model methods"""
+    user = User.query.filter(User.points.isnot(None)).order_by(User.id
+                                                               ).first()
+    user_id = user.id
+    return [
+        ("Tournaments.get_active", lambda: Tournaments.get_active(limit=10)),
+        ("User.calculate_points",
+         lambda: User.query.get(user_id).calculate_points()),
+        ("User.get_leaderboard", lambda: User.get_leaderboard(limit=100)),
+    ]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q / 100), len(values) - 1)]
+
+
+@contextmanager
+def counting_queries():
+    """Yields a list whose first item counts the statements executed"""
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    # GET requests read from the replicas if configured
+    engines = [db.engine] + [db.get_engine(app, bind=bind)
+                             for bind in replica_binds(app.config)]
+    for engine in engines:
+        db.event.listen(engine, "before_cursor_execute", count)
+    try:
+        yield queries
+    finally:
+        for engine in engines:
+            db.event.remove(engine, "before_cursor_execute", count)
+
+
+def measure(run, requests, cached):
+    """Returns latency percentiles (ms), queries and peak memory (KB)"""
+    run()
+    latencies = []
+    for _ in range(requests):
+        if not cached:
+            httpcache.responses.clear()
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+    # One more run for queries and memory, tracemalloc slows it down
+    if not cached:
+        httpcache.responses.clear()
+    with counting_queries() as queries:
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {"p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "queries": queries[0],
+            "peak_kb": round(peak / 1024, 1)}
+
+
+def request(client, path):
+    def run():
+        response = client.get(path)
+        # Streamed bodies are generated while reading
+        response.data
+        assert response.status_code == 200, (path, response.status_code)
+        db.session.remove()
+    return run
+
+
+def compare(name, result, baseline):
+    """Returns the change against the baseline as text"""
+    old = baseline.get(name)
+    if old is None:
+        return "new"
+    change = (result["p50"] - old["p50"]) / old["p50"] * 100 \
+        if old["p50"] else 0
+    text = f"{change:+.0f}% p50, {result['queries'] - old['queries']:+d} " \
+           "queries"
+    if result["p50"] > old["p50"] * TOLERANCE + 1 or \
+       result["queries"] > old["queries"]:
+        text += " REGRESSION"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--cached", action="store_true",
+                        help="keep the HTTP response cache between requests")
+    parser.add_argument("--skip-maintenance", action="store_true")
+    args = parser.parse_args()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    client = app.test_client()
+    benchmarks = [(name, request(client, path))
+                  for name, path in endpoints()] + functions()
+    results = {}
+    print(f"{'':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'queries':>7} {'peak KB':>9}")
+    for name, run in benchmarks:
+        result = results[name] = measure(run, args.requests, args.cached)
+        line = f"{name:<24} {result['p50']:>8.2f} {result['p95']:>8.2f} " \
+               f"{result['p99']:>8.2f} {result['queries']:>7} " \
+               f"{result['peak_kb']:>9.1f}"
+        if args.baseline:
+            line += "  " + compare(name, result, baseline)
+        print(line)
+    if not args.skip_maintenance:
+        # A single run, counting statements costs next to nothing
+        with counting_queries() as queries:
+            start = time.perf_counter()
+            timings = maintenance()
+            duration = round((time.perf_counter() - start) * 1000, 3)
+        result = results["maintenance"] = {
+            "p50": duration, "p95": duration, "p99": duration,
+            "queries": queries[0], "peak_kb": None, "phases": timings}
+        line = f"{'maintenance':<24} {duration:>8.2f} ms " \
+               f"{queries[0]} queries " + ", ".join(
+                   f"{phase} {seconds}s" for phase, seconds in timings.items())
+        if args.baseline:
+            line += "  " + compare("maintenance", result, baseline)
+        print(line)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"database": db.engine.dialect.name,
+                       "users": User.query.count(),
+                       "requests": args.requests, "cached": args.cached,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
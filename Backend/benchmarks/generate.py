@@ -0,0 +1,131 @@
+# Bulk loads a synthetic dataset into the configured database
+# Run from the Backend folder:
+#   python -m benchmarks.generate [users] [tournaments] [games] [seed]
+# Production scale: python -m benchmarks.generate 100000 10000 5000000
+# All users get the password "password"
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault("SCHEDULER", "off")
+
+from app import db
+from app.models import (User, Tournaments, TournamentPlayers, Games,
+                        UserGames, TournamentGames, GameResults, Counters)
+from app.utils.rating import rate_all
+from app.utils.transfer import sync_sequence
+from werkzeug.security import generate_password_hash
+
+
+def next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def insert(table, rows, chunk_size=10000):
+    """Inserts rows of any iterable in chunks of executemany"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+
+
+def generate_users(count):
+    first = next_id(User)
+    password = generate_password_hash("password")
+    insert(User.__table__, (dict(id=id, username=f"user{id}",
+                                 password=password, points=None)
+                            for id in range(first, first + count)))
+    sync_sequence(User.__table__)
+    # Core inserts bypass the ORM listener which bumps the leaderboard
+    Counters.bump("leaderboard")
+    db.session.commit()
+    return list(range(first, first + count))
+
+
+def generate_tournaments(count, user_ids):
+    """Returns {tournament_id: [participant ids]}"""
+    first = next_id(Tournaments)
+    today = date.today()
+    tournaments, participants = [], {}
+    for id in range(first, first + count):
+        start = today + timedelta(days=random.randint(-730, 30))
+        duration = random.randint(1, 14)
+        tournaments.append(dict(
+            id=id, name=f"Tournament {id}", date=start, duration=duration,
+            description="Synthetic tournament", end_date=max(
+                start, start + timedelta(days=duration)),
+            maintainer_id=random.choice(user_ids)))
+        participants[id] = random.sample(
+            user_ids, min(random.choice([8, 16, 32, 64]), len(user_ids)))
+    insert(Tournaments.__table__, tournaments)
+    insert(TournamentPlayers.__table__, (
+        dict(tournament_id=id, user_id=user_id)
+        for id, user_ids in participants.items() for user_id in user_ids))
+    sync_sequence(Tournaments.__table__)
+    db.session.commit()
+    return participants
+
+
+def generate_games(count, user_ids, participants, chunk_size=5000):
+    """
+    Inserts games of 4 players with a result, 70% belong to a tournament
+    Most games are finished, game_results and user_games are kept in sync
+    """
+    first = next_id(Games)
+    today = date.today()
+    tournament_ids = list(participants)
+    for start in range(first, first + count, chunk_size):
+        games, links, players, results = [], [], [], []
+        for id in range(start, min(start + chunk_size, first + count)):
+            if tournament_ids and random.random() < 0.7:
+                tournament_id = random.choice(tournament_ids)
+                pool = participants[tournament_id]
+                links.append(dict(tournament_id=tournament_id, game_id=id))
+            else:
+                pool = user_ids
+            table = random.sample(pool, min(4, len(pool)))
+            result = [dict(user_id=user_id, points=placement)
+                      for placement, user_id in enumerate(table, 1)]
+            games.append(dict(
+                id=id, result=result, type=True,
+                date=today - timedelta(days=random.randint(0, 730)),
+                duration=random.randint(10, 90),
+                state=0 if random.random() < 0.95 else random.choice(
+                    [1, 2, 3])))
+            players.extend(dict(game_id=id, user_id=user_id)
+                           for user_id in table)
+            results.extend(GameResults.rows(id, result))
+        insert(Games.__table__, games)
+        insert(TournamentGames.__table__, links)
+        insert(UserGames.__table__, players)
+        insert(GameResults.__table__, results)
+        sync_sequence(Games.__table__)
+        db.session.commit()
+
+
+def main(users=10000, tournaments=1000, games=100000, seed=0):
+    random.seed(seed)
+    timings = {}
+    start = time.perf_counter()
+    user_ids = generate_users(users)
+    timings["users"] = time.perf_counter() - start
+    participants = generate_tournaments(tournaments, user_ids)
+    timings["tournaments"] = time.perf_counter() - start - sum(
+        timings.values())
+    generate_games(games, user_ids, participants)
+    timings["games"] = time.perf_counter() - start - sum(timings.values())
+    rate_all()
+    timings["ratings"] = time.perf_counter() - start - sum(timings.values())
+    print(f"{users} users, {tournaments} tournaments, {games} games: " +
+          ", ".join(f"{name} {duration:.1f}s"
+                    for name, duration in timings.items()))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,103 @@
+# Load test with many concurrent polling clients against a running server
+# Run from the Backend folder:
+#   python -m benchmarks.load URL [connections,...] [seconds] [tournament id]
+# e.g. compare the sync workers with the ASGI tier on the same database
+#   gunicorn -w 4 -b 127.0.0.1:8000 app:app
+#   uvicorn --port 8001 asgi:application
+#   python -m benchmarks.load http://127.0.0.1:8000 10,100,1000
+#   python -m benchmarks.load http://127.0.0.1:8001 10,100,1000
+import asyncio
+import sys
+import time
+from urllib.parse import urlsplit
+
+PATHS = ["/api/tournaments/ongoing",
+         "/api/tournament/{tournament}/games?limit=100",
+         "/api/user/leaderboard?limit=100"]
+
+
+async def read_response(reader):
+    """Returns (status, keep_alive) after reading a whole response"""
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip().lower()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get("connection") != "close"
+
+
+async def client(host, port, paths, deadline, results):
+    """Polls the paths on one keep-alive connection until the deadline"""
+    connection, index = None, 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            reader, writer = connection
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                         "Accept: application/json\r\n\r\n".encode())
+            status, keep_alive = await asyncio.wait_for(
+                read_response(reader), deadline - start + 10)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ValueError, IndexError):
+            results["errors"] += 1
+            connection = None
+            await asyncio.sleep(0.1)
+            continue
+        if status == 200:
+            results["latencies"].append(time.perf_counter() - start)
+        else:
+            results["errors"] += 1
+        if not keep_alive:
+            writer.close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+def percentile(values, q):
+    return values[min(int(len(values) * q / 100), len(values) - 1)] * 1000
+
+
+async def run(url, connections, seconds, tournament):
+    parts = urlsplit(url)
+    paths = [path.format(tournament=tournament) for path in PATHS]
+    results = {"latencies": [], "errors": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(parts.hostname, parts.port or 80, paths, start + seconds,
+               results) for _ in range(connections)])
+    duration = time.perf_counter() - start
+    latencies = sorted(results["latencies"]) or [0]
+    print(f"{connections:>6} {len(results['latencies']) / duration:>9.1f} "
+          f"{percentile(latencies, 50):>8.1f} "
+          f"{percentile(latencies, 95):>8.1f} "
+          f"{percentile(latencies, 99):>8.1f} {results['errors']:>7}")
+
+
+def main(url, connections="10,100,1000", seconds=10, tournament=1):
+    print(f"{url}, {seconds}s per level")
+    print("  conn     req/s   p50 ms   p95 ms   p99 ms  errors")
+    for count in connections.split(","):
+        asyncio.run(run(url, int(count), float(seconds), tournament))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
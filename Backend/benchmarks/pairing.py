@@ -0,0 +1,80 @@
+# Benchmark for generating a round with the pairing engine
+# Run from the Backend folder: python -m benchmarks.pairing [players] [rounds]
+import random
+import sys
+import time
+from datetime import date
+from app import db
+from app.models import (User, Tournaments, TournamentPlayers, Games,
+                        UserGames, TournamentGames)
+from app.utils.pairing import pair_round
+
+
+def main(players=1000, rounds=8):
+    random.seed(0)
+    participants = [(id, random.randint(0, 200)) for id in range(players)]
+    played, history = {}, []
+    for number in range(rounds + 1):
+        start = time.perf_counter()
+        tables, byes = pair_round(participants, played)
+        duration = (time.perf_counter() - start) * 1000
+        rematches = sum(1 for table in tables for a in table for b in table
+                        if a < b and b in played.get(a, ()))
+        print(f"round {number + 1}: {len(tables)} tables, {len(byes)} byes, "
+              f"{rematches} rematches in {duration:.1f} ms")
+        history.extend(tables)
+        for table in tables:
+            for id in table:
+                played.setdefault(id, set()).update(table)
+        # Shuffle the points a bit between rounds
+        participants = [(id, points + random.randint(-5, 5))
+                        for id, points in participants]
+    return history
+
+
+def load(history, players=1000):
+    """
+    Stores the simulated tournament and times Tournaments.pair_round
+    Nothing is committed, the transaction is rolled back afterwards
+    """
+    try:
+        store(history, players)
+    finally:
+        db.session.rollback()
+
+
+def store(history, players):
+    maintainer = User(username=f"pairing-{time.time()}", password="")
+    db.session.add(maintainer)
+    db.session.flush()
+    tournament = Tournaments(name="Pairing benchmark", date=date.today(),
+                             maintainer_id=maintainer.id)
+    db.session.add(tournament)
+    db.session.flush()
+    first = db.session.query(db.func.max(User.id)).scalar() + 1
+    db.session.execute(User.__table__.insert(), [
+        dict(id=first + id, username=f"pairing-{first + id}", password="",
+             points=random.randint(0, 200)) for id in range(players)])
+    db.session.execute(TournamentPlayers.__table__.insert(), [
+        dict(tournament_id=tournament.id, user_id=first + id)
+        for id in range(players)])
+    game = (db.session.query(db.func.max(Games.id)).scalar() or 0) + 1
+    games = list(range(game, game + len(history)))
+    db.session.execute(Games.__table__.insert(), [
+        dict(id=id, date=date.today(), state=0) for id in games])
+    db.session.execute(TournamentGames.__table__.insert(), [
+        dict(tournament_id=tournament.id, game_id=id) for id in games])
+    db.session.execute(UserGames.__table__.insert(), [
+        dict(game_id=id, user_id=first + user) for id, table
+        in zip(games, history) for user in table])
+    # pair_round reads the uncommitted rows of this transaction
+    start = time.perf_counter()
+    tables, byes = tournament.pair_round()
+    duration = (time.perf_counter() - start) * 1000
+    print(f"Tournaments.pair_round with {players} stored players: "
+          f"{len(tables)} tables in {duration:.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    load(main(*args), *args[:1])
@@ -36,6 +36,83 @@ class Config(object):
         SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(basedir,
                                                               "app.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool per worker process (not used for SQLite), connections
+    # are recycled after DB_POOL_RECYCLE seconds and checked before use
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+    # Statements of requests running longer are cancelled (milliseconds,
+    # PostgreSQL only, 0 disables it), maintenance and CLI commands have no
+    # timeout
+    DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 30000))
+    # Comma separated URIs of read replicas, GET requests read from them
+    # unless the client wrote in the last REPLICA_STICKY_SECONDS (should be
+    # longer than the replication lag and needs a shared CACHE_URL with
+    # several workers)
+    DATABASE_REPLICAS = [uri for uri in os.getenv(
+        "DATABASE_REPLICAS", "").split(",") if uri]
+    SQLALCHEMY_BINDS = {f"replica{index}": uri
+                        for index, uri in enumerate(DATABASE_REPLICAS)}
+    REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
+    # Points are updated when a game is finished, the nightly maintenance
+    # only checks (and repairs) them unless a full rebuild is requested
+    RATING_FULL_REBUILD = os.getenv("RATING_FULL_REBUILD") == "1"
+    RATING_CONSISTENCY_CHECK = os.getenv("RATING_CONSISTENCY_CHECK",
+                                         "1") == "1"
+
+    # "leader": the process holding the scheduler lock (PostgreSQL advisory
+    # lock or SCHEDULER_LOCK file) runs maintenance, "off": never
+    SCHEDULER = os.getenv("SCHEDULER") or "leader"
+    SCHEDULER_LOCK = os.getenv("SCHEDULER_LOCK") or os.path.join(
+        basedir, "scheduler.lock")
+    SCHEDULER_ELECTION_INTERVAL = 60
+    # Missed runs are caught up if a leader is elected within this time
+    SCHEDULER_MISFIRE_GRACE = 6 * 3600
+    # Writes are blocked at most this long if a worker crashed in maintenance
+    MAINTENANCE_BLOCK_TIMEOUT = 600
+
+    # Cache shared by auth, role and response caches: "local" keeps them
+    # per worker, "sqlite:////path/cache.db" or "redis://localhost:6379/0"
+    # share them (and their invalidations) between all gunicorn workers
+    CACHE_URL = os.getenv("CACHE_URL") or "local"
+    CACHE_LOCAL_SIZE = 8192
+
+    # Verified tokens and passwords are cached for at most AUTH_CACHE_TTL
+    # seconds (0 disables the cache), changes of a user may show up late
+    AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", 60))
+    # Failed password logins per username and client address before further
+    # attempts of the address are rejected without hashing, until
+    # AUTH_FAILED_WINDOW seconds after the first failure
+    AUTH_MAX_FAILED = 10
+    AUTH_FAILED_WINDOW = 300
+
+    # Response cache of read mostly GET endpoints, bodies larger than
+    # HTTP_CACHE_MAX_BODY bytes are streamed but not cached
+    HTTP_CACHE_TTL = 3600
+    HTTP_CACHE_MAX_BODY = 1024 * 1024
+    # Bodies cached per worker with CACHE_URL=local, in an LRU of their own
+    HTTP_CACHE_LOCAL_BYTES = int(os.getenv("HTTP_CACHE_LOCAL_BYTES",
+                                           64 * 1024 * 1024))
+    # max-age send in Cache-Control, 0 makes proxies revalidate the ETag
+    HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", 0))
+
+    # Every event stream holds a worker thread until the client disconnects,
+    # keep this below the threads per worker (WEB_THREADS in the Procfile)
+    # so streams can't take every thread
+    EVENT_STREAMS_MAX = int(os.getenv("EVENT_STREAMS_MAX", 16))
+
+    # SQLite connections wait this long (milliseconds) for a lock
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS") or "NORMAL"
+    # The nightly vacuum frees at most VACUUM_MAX_PAGES free pages of SQLite
+    # in steps of VACUUM_STEP pages, PostgreSQL vacuums VACUUM_TABLES
+    # (comma separated, default all tables)
+    VACUUM_MAX_PAGES = int(os.getenv("VACUUM_MAX_PAGES", 25000))
+    VACUUM_STEP = 1000
+    VACUUM_TABLES = [table for table in os.getenv(
+        "VACUUM_TABLES", "").split(",") if table]
 
     # Flask-User settings
     USER_ENABLE_CHANGE_USERNAME = True
@@ -0,0 +1,77 @@
+# Run from the Backend folder: python -m pytest tests
+import os
+import tempfile
+
+# The app is configured and the database created on import
+directory = tempfile.mkdtemp(prefix="penta-tests-")
+os.environ.setdefault("SECRET_KEY", "testing")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "app.db")
+os.environ["SCHEDULER"] = "off"
+os.environ["CACHE_URL"] = "local"
+os.environ["DATABASE_REPLICAS"] = ""
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from app import app, db
+from app.models import User, Games
+from app.utils import auth, cache, results
+from app.utils.events import broker
+from app.utils.leaderboard import leaderboard
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """Every test starts with empty tables and caches"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    for backend in cache.backends.values():
+        backend.data.clear()
+    auth.passwords.clear()
+    results.backfilled = False
+    leaderboard.__init__()
+    broker.__init__(max_subscriptions=app.config["EVENT_STREAMS_MAX"])
+    yield db
+    db.session.remove()
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries():
+    """Returns a list every executed statement is appended to"""
+    statements = []
+
+    def count(connection, cursor, statement, parameters, context,
+              executemany):
+        statements.append(statement)
+    db.event.listen(db.engine, "before_cursor_execute", count)
+    yield statements
+    db.event.remove(db.engine, "before_cursor_execute", count)
+
+
+def create_users(count, points=None):
+    """Creates users named user0, user1, ... and returns them"""
+    users = [User(username=f"user{index}", password="",
+                  points=None if points is None else points[index])
+             for index in range(count)]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+def play(users, placements, finish=True):
+    """Creates a game of users with placements and finishes it"""
+    master, = Games.create_matches(1, rounds=0,
+                                   tables=[[user.id for user in users]])
+    game = Games.query.get(master)
+    game.result = [dict(user_id=user.id, points=placement)
+                   for user, placement in zip(users, placements)]
+    if finish:
+        game.finish()
+    else:
+        db.session.commit()
+    return game
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import pytest
+from app.models import Tournaments, Games
+from app.utils.pagination import encode_cursor
+from conftest import create_users
+from datetime import date
+
+pytest.importorskip("aiosqlite")
+import asgi  # noqa: E402
+
+
+def get(path, query=""):
+    """Returns (status, body) of a GET request to the ASGI application"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    async def request():
+        await asgi.database.connect()
+        try:
+            await asgi.application({
+                "type": "http", "method": "GET", "path": path,
+                "query_string": query.encode(), "headers": []},
+                receive, send)
+        finally:
+            await asgi.database.close()
+    asyncio.run(request())
+    body = b"".join(message.get("body", b"") for message in messages)
+    return messages[0]["status"], json.loads(body)
+
+
+def create_games():
+    users = create_users(1)
+    tournament, = Tournaments.create_many([dict(
+        name="t", date=date.today(), duration=1, participants=[])],
+        users[0].id)
+    Games.create_matches(3, rounds=0, tournament_id=tournament.id)
+    return tournament.id
+
+
+def test_games_match_flask(client):
+    id = create_games()
+    status, games = get(f"/api/tournament/{id}/games")
+    assert status == 200
+    assert games == client.get(f"/api/tournament/{id}/games").get_json()
+    assert {game["state"] for game in games} == {"ready"}
+
+
+@pytest.mark.parametrize("query", [f"cursor={encode_cursor(['1'])}",
+                                   f"cursor={encode_cursor([[1]])}",
+                                   "limit=-1"])
+def test_invalid_arguments(client, query):
+    id = create_games()
+    assert get(f"/api/tournament/{id}/games", query)[0] == 400
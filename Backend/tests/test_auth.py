@@ -0,0 +1,88 @@
+import base64
+from app import app, db
+from app.models import User, Role, UserRoles
+from app.utils import auth
+from app.utils.auth import verify_token, verify_credentials
+from app.utils.cache import backends
+
+
+def create_user(username="alice", password="secret"):
+    user = User(username=username)
+    user.hash_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def basic(username, password):
+    credentials = base64.b64encode(f"{username}:{password}".encode())
+    return {"Authorization": "Basic " + credentials.decode()}
+
+
+def test_token_login(client):
+    create_user()
+    response = client.get("/api/user/token", headers=basic("alice", "secret"))
+    assert response.status_code == 200
+    token = response.get_json()["token"]
+    assert client.get("/api/user/token", headers=basic(
+        token, "")).status_code == 200
+
+
+def test_verified_tokens_are_cached(count_queries):
+    user = create_user()
+    _, token = user.generate_auth_token()
+    with app.test_request_context():
+        assert verify_token(token.decode()).id == user.id
+        del count_queries[:]
+        assert verify_token(token.decode()).id == user.id
+        assert count_queries == []
+
+
+def test_failed_logins_are_limited_per_address():
+    create_user()
+    with app.test_request_context():
+        for _ in range(app.config["AUTH_MAX_FAILED"]):
+            assert verify_credentials("alice", "wrong", "10.0.0.1") is None
+        assert verify_credentials("alice", "secret", "10.0.0.1") is None
+        # Other clients can still log in
+        assert verify_credentials("alice", "secret", "10.0.0.2") is not None
+
+
+def test_failed_logins_window_is_not_extended():
+    cache = auth.failed
+    assert [cache.incr("key", ttl=60) for _ in range(3)] == [1, 2, 3]
+    expires = cache.backend.data.data[cache.prefix() + repr("key")][0]
+    cache.incr("key", ttl=60)
+    assert cache.backend.data.data[cache.prefix() + repr("key")][0] == \
+        expires
+
+
+def test_only_ids_are_cached(client):
+    user = create_user()
+    _, token = user.generate_auth_token()
+    client.get("/api/user/token", headers=basic("alice", "secret"))
+    client.get("/api/user/token", headers=basic(token.decode(), ""))
+    values = [entry[1] for entry in backends["local"].data.data.values()]
+    assert (user.id, ()) in values
+    assert not any(isinstance(value, User) for value in values)
+    assert not any(token.decode() in repr(key) or "secret" in repr(key)
+                   for key in backends["local"].data.data)
+
+
+def test_role_required(client):
+    user = create_user()
+    headers = basic("alice", "secret")
+    assert client.get("/api/admin/cache", headers=headers).status_code == 403
+    # Adding the role clears the cached role ids
+    role = Role(name="admin")
+    db.session.add(role)
+    db.session.commit()
+    db.session.add(UserRoles(user_id=user.id, role_id=role.id))
+    db.session.commit()
+    # Cached users keep their roles until AUTH_CACHE_TTL, log in anew
+    user = User.query.get(user.id)
+    user.hash_password("other")
+    db.session.commit()
+    response = client.get("/api/admin/cache", headers=basic("alice", "other"))
+    assert response.status_code == 200
+    assert response.get_json()["backend"] == "local"
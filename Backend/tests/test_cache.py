@@ -0,0 +1,38 @@
+from app.utils.cache import Cache, LocalBackend, SQLiteBackend
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "cache.db")
+    # Every worker opens the file on its own
+    first = Cache(SQLiteBackend(path), "auth", generation_ttl=0)
+    second = Cache(SQLiteBackend(path), "auth", generation_ttl=0)
+    first.set("token", {"id": 1})
+    assert second.get("token") == {"id": 1}
+    second.clear()
+    assert first.get("token") is None
+    first.set("token", {"id": 2})
+    assert second.get("token") == {"id": 2}
+
+
+def test_clear_only_invalidates_its_namespace():
+    backend = LocalBackend()
+    auth, roles = Cache(backend, "auth"), Cache(backend, "roles")
+    auth.set(1, "a")
+    roles.set(1, "b")
+    auth.clear()
+    assert auth.get(1) is None and roles.get(1) == "b"
+
+
+def test_zero_ttl_is_not_cached():
+    cache = Cache(LocalBackend(), "auth", ttl=0)
+    cache.set(1, "a")
+    assert cache.get(1) is None
+
+
+def test_counters_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = Cache(SQLiteBackend(path), "auth-failed", generation_ttl=0)
+    second = Cache(SQLiteBackend(path), "auth-failed", generation_ttl=0)
+    assert first.incr("alice", ttl=60) == 1
+    assert second.incr("alice", ttl=60) == 2
+    assert first.get("alice") == 2
@@ -0,0 +1,104 @@
+from app import db
+from app.models import User, Tournaments, Games
+from app.utils.events import Broker, broker
+from conftest import create_users
+from datetime import date
+
+
+def create_game():
+    users = create_users(1)
+    tournament, = Tournaments.create_many([dict(
+        name="t", date=date.today(), duration=1, participants=[])],
+        users[0].id)
+    master, = Games.create_matches(1, rounds=0, tournament_id=tournament.id)
+    return tournament.id, Games.query.get(master)
+
+
+def received(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait()[1])
+    return events
+
+
+def test_commit_publishes_changes():
+    tournament_id, game = create_game()
+    subscription = broker.subscribe(tournament_id)
+    game.state = 3
+    db.session.commit()
+    assert [event["state"] for event in received(subscription)] == \
+        ["paused"]
+
+
+def test_expired_state_is_loaded():
+    tournament_id, game = create_game()
+    subscription = broker.subscribe(tournament_id)
+    game.result = [dict(user_id=1, points=1)]
+    # e.g. expired by a refresh of other attributes
+    db.session.expire(game, ["state"])
+    db.session.commit()
+    assert [event["state"] for event in received(subscription)] == \
+        ["ready"]
+
+
+def test_rollback_discards_changes():
+    tournament_id, game = create_game()
+    subscription = broker.subscribe(tournament_id)
+    game.state = 3
+    db.session.flush()
+    db.session.rollback()
+    # An unrelated commit
+    db.session.add(User(username="other", password=""))
+    db.session.commit()
+    assert received(subscription) == []
+
+
+def test_savepoint_rollback_discards_its_changes():
+    tournament_id, game = create_game()
+    other = Games.query.get(Games.create_matches(
+        1, rounds=0, tournament_id=tournament_id)[0])
+    subscription = broker.subscribe(tournament_id)
+    game.state = 1
+    db.session.flush()
+    savepoint = db.session.begin_nested()
+    other.state = 3
+    db.session.flush()
+    savepoint.rollback()
+    db.session.commit()
+    assert [(event["id"], event["state"])
+            for event in received(subscription)] == [(game.id, "running")]
+
+
+def test_recent_events_are_bounded():
+    events = Broker(backlog=2, tournaments=3)
+    for tournament_id in range(10):
+        for number in range(5):
+            events.publish(tournament_id, number)
+    assert list(events.recent) == [7, 8, 9]
+    assert [data for _, data in events.recent[9]] == [3, 4]
+    subscription = events.subscribe(9, last_event_id=0)
+    assert received(subscription) == [3, 4]
+
+
+def test_subscriptions_are_limited(client):
+    tournament_id, _ = create_game()
+    events = Broker(max_subscriptions=2)
+    first = events.subscribe(tournament_id)
+    assert events.subscribe(tournament_id) is not None
+    assert events.subscribe(tournament_id) is None
+    events.unsubscribe(first)
+    events.unsubscribe(first)
+    assert events.subscribe(tournament_id) is not None
+    assert events.subscribe(tournament_id) is None
+
+
+def test_overflow_closes_the_stream():
+    events = Broker(queue_size=2)
+    subscription = events.subscribe(1)
+    for number in range(4):
+        events.publish(1, number)
+    assert subscription.overflowed
+    # No events after the dropped ones, the client reconnects instead
+    assert list(events.listen(subscription, timeout=0)) == []
+    replayed = events.subscribe(1, last_event_id=2)
+    assert received(replayed) == [2, 3]
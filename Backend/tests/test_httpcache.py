@@ -0,0 +1,65 @@
+from app import db
+from app.models import Counters
+from app.utils import httpcache
+from app.utils.cache import TTLCache
+from conftest import create_users
+from sqlalchemy.dialects import postgresql
+
+
+def test_not_modified(client):
+    create_users(3, points=[1, 2, 3])
+    response = client.get("/api/user/leaderboard")
+    etag = response.headers["ETag"]
+    assert client.get("/api/user/leaderboard", headers={
+        "If-None-Match": etag}).status_code == 304
+
+
+def test_unknown_args_share_an_entry(client):
+    create_users(3, points=[1, 2, 3])
+    client.get("/api/tournaments/list?limit=0").get_data()
+    misses = httpcache.stats["misses"]
+    for number in range(20):
+        response = client.get(f"/api/tournaments/list?limit=0&x={number}")
+        assert response.get_data() == b"[]\n"
+    assert httpcache.stats["misses"] == misses
+    assert len(httpcache.responses.backend.data) == 1
+
+
+def test_responses_are_bounded_by_bytes():
+    cache = TTLCache(maxsize=100, maxbytes=1000, sizeof=len)
+    for number in range(10):
+        cache.set(number, b"x" * 300)
+    assert len(cache) == 3 and cache.bytes == 900
+    assert cache.get(9) is not None and cache.get(0) is None
+    cache.set("large", b"x" * 2000)
+    assert cache.get("large") is None and cache.bytes == 900
+    cache.pop(9)
+    assert cache.bytes == 600
+
+
+class Recorder(object):
+    """Connection compiling the statements sent to it for PostgreSQL"""
+
+    def __init__(self):
+        self.dialect = postgresql.dialect()
+        self.statements = []
+
+    def execute(self, statement, *args):
+        self.statements.append(str(statement.compile(dialect=self.dialect)))
+
+
+def test_counters_are_created_by_their_first_bump():
+    Counters.bump("table:a", "table:b")
+    Counters.bump("table:b")
+    db.session.commit()
+    assert Counters.get_many(["table:a", "table:b"]) == {
+        "table:a": 1, "table:b": 2}
+
+
+def test_counters_are_bumped_by_one_upsert_on_postgresql():
+    connection = Recorder()
+    Counters.bump("table:b", "table:a", connection=connection)
+    statement, = connection.statements
+    assert statement.startswith("INSERT INTO counters (name, value) VALUES")
+    assert "ON CONFLICT (name) DO UPDATE SET value = (counters.value + " \
+        in statement
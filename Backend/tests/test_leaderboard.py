@@ -0,0 +1,31 @@
+from app import db
+from app.models import User
+from conftest import create_users
+
+
+def test_rank_with_shared_points(client):
+    create_users(5, points=[10, 30, 20, 30, 0])
+    response = client.get("/api/user/3/rank?neighbours=1")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["rank"] == 3
+    assert [(entry["id"], entry["rank"]) for entry in data["neighbours"]] == \
+        [(2, 1), (3, 3), (1, 4)]
+    assert client.get("/api/user/4/rank").get_json()["rank"] == 1
+    assert client.get("/api/user/2/rank").get_json()["rank"] == 1
+
+
+def test_unrated_users_have_no_rank(client):
+    create_users(2, points=[10, 0])
+    # points default to 0, only None is unrated
+    User.query.get(2).points = None
+    db.session.commit()
+    assert client.get("/api/user/2/rank").status_code == 404
+
+
+def test_rank_follows_rating_changes(client):
+    create_users(2, points=[10, 20])
+    assert client.get("/api/user/1/rank").get_json()["rank"] == 2
+    User.query.get(1).points = 30
+    db.session.commit()
+    assert client.get("/api/user/1/rank").get_json()["rank"] == 1
@@ -0,0 +1,26 @@
+from app.models import Games, TournamentGames, UserGames, matchgames
+
+
+def test_matches_in_constant_statements(count_queries):
+    # The first commit creates the tables' version counters
+    Games.create_matches(1, tables=[[1, 2, 3, 4]])
+    counts = []
+    for count in (2, 20):
+        del count_queries[:]
+        masters = Games.create_matches(count, rounds=3, tables=[
+            [1, 2, 3, 4]] * count)
+        assert len(masters) == count
+        counts.append(len(count_queries))
+    assert counts[0] == counts[1]
+
+
+def test_match_structure():
+    master, = Games.create_matches(1, rounds=3, tournament_id=7,
+                                   tables=[[1, 2]])
+    slaves = [row.slave_id for row in matchgames.query.filter_by(
+        master_id=master)]
+    assert len(slaves) == 3
+    assert {row.game_id for row in TournamentGames.query.filter_by(
+        tournament_id=7)} == {master, *slaves}
+    assert UserGames.query.count() == 8
+    assert {game.state for game in Games.query} == {2}
@@ -0,0 +1,33 @@
+import pytest
+from app import db
+from app.utils import metrics
+from app.utils.metrics import Histogram
+from conftest import create_users
+from sqlalchemy.exc import OperationalError
+
+
+def test_server_timing(client):
+    create_users(1)
+    response = client.get("/api/tournaments/ongoing")
+    assert response.status_code == 200
+    assert 'db;desc="2 queries"' in response.headers["Server-Timing"]
+    recorded = metrics.get_endpoint("GET /api/tournaments/ongoing")
+    assert recorded.queries.count >= 1
+
+
+def test_histogram_percentiles():
+    histogram = Histogram((1, 2, 5, 10))
+    for value in [0.5] * 90 + [4] * 9 + [50]:
+        histogram.observe(value)
+    assert histogram.percentile(50) == 1
+    assert histogram.percentile(95) == 5
+    assert histogram.percentile(100) == 50
+    assert histogram.jsonify()["count"] == 100
+
+
+def test_failed_statements_leave_no_timings_behind():
+    with db.engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute("SELECT * FROM missing")
+        connection.execute("SELECT 1")
+        assert "query_start" not in connection.info
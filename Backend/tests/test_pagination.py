@@ -0,0 +1,72 @@
+import json
+import pytest
+from app.models import Tournaments, Games
+from app.utils.pagination import encode_cursor
+from conftest import create_users
+from datetime import date
+
+
+def test_list_pages(client):
+    create_users(5)
+    first = client.get("/api/user/list?limit=2")
+    assert [user["id"] for user in first.get_json()] == [1, 2]
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(f"/api/user/list?limit=2&cursor={cursor}")
+    assert [user["id"] for user in second.get_json()] == [3, 4]
+
+
+def test_leaderboard_pages(client):
+    create_users(5, points=[10, 30, 20, 30, 0])
+    first = client.get("/api/user/leaderboard?limit=3")
+    assert [user["id"] for user in first.get_json()] == [4, 2, 3]
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(f"/api/user/leaderboard?limit=3&cursor={cursor}")
+    assert [user["id"] for user in second.get_json()] == [1, 5]
+    assert "X-Next-Cursor" not in second.headers
+
+
+@pytest.mark.parametrize("values", [["a", "b"], [None, 1], [[1], 2],
+                                    [True, 1], [1.5, 1], [1]])
+def test_leaderboard_rejects_invalid_cursors(client, values):
+    create_users(2, points=[1, 2])
+    response = client.get("/api/user/leaderboard?cursor="
+                          f"{encode_cursor(values)}")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [encode_cursor([[1]]),
+                                    encode_cursor(["1"]),
+                                    encode_cursor({"id": 1}), "%%%"])
+def test_games_reject_invalid_cursors(client, cursor):
+    users = create_users(1)
+    tournament, = Tournaments.create_many([dict(
+        name="t", date=date.today(), duration=1, participants=[])],
+        users[0].id)
+    Games.create_matches(2, rounds=0, tournament_id=tournament.id)
+    response = client.get(f"/api/tournament/{tournament.id}/games?"
+                          f"cursor={cursor}")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/api/user/list", "/api/user/leaderboard",
+                                  "/api/tournaments/list",
+                                  "/api/tournaments/ongoing"])
+def test_negative_limits_are_rejected(client, path):
+    create_users(2)
+    assert client.get(f"{path}?limit=-1").status_code == 400
+
+
+def test_ndjson(client):
+    create_users(3)
+    response = client.get("/api/user/list", headers={
+        "Accept": "application/x-ndjson"})
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in
+            response.get_data(as_text=True).splitlines()] == [1, 2, 3]
+
+
+def test_all_records_are_streamed(client):
+    create_users(150)
+    response = client.get("/api/user/list?limit=0")
+    assert len(response.get_json()) == 150
+    assert "X-Next-Cursor" not in response.headers
@@ -0,0 +1,52 @@
+import base64
+from app import db
+from app.models import Tournaments
+from app.utils.pairing import pair_round
+from conftest import create_users
+from datetime import date
+
+
+def test_tables_by_points():
+    players = [(id, 100 - id) for id in range(10)]
+    tables, byes = pair_round(players, {})
+    assert tables == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert byes == [8, 9]
+
+
+def test_rematches_are_avoided():
+    players = [(id, 100 - id) for id in range(16)]
+    played = {}
+    for first in range(0, 16, 4):
+        table = list(range(first, first + 4))
+        for id in table:
+            played.setdefault(id, set()).update(table)
+    tables, byes = pair_round(players, played)
+    assert byes == [] and len(tables) == 4
+    for table in tables:
+        assert sorted(id // 4 for id in table) == [0, 1, 2, 3]
+
+
+def test_unavoidable_rematches():
+    players = [(id, 0) for id in range(4)]
+    played = {id: {0, 1, 2, 3} for id in range(4)}
+    assert pair_round(players, played) == ([[0, 1, 2, 3]], [])
+
+
+def test_schedule_round(client):
+    users = create_users(9)
+    maintainer = users[0]
+    maintainer.hash_password("secret")
+    db.session.commit()
+    tournament, = Tournaments.create_many([dict(
+        name="t", date=date.today(), duration=1,
+        participants=[user.id for user in users])], maintainer.id)
+    id = tournament.id
+    credentials = base64.b64encode(b"user0:secret").decode()
+    response = client.post(f"/api/tournament/{id}/round",
+                           json={"rounds": 2},
+                           headers={"Authorization": f"Basic {credentials}"})
+    assert response.status_code == 201
+    data = response.get_json()
+    assert len(data["matches"]) == 2 and len(data["byes"]) == 1
+    # Every match is a master game with 2 rounds, all in the tournament
+    assert Tournaments.query.get(id).games.count() == 6
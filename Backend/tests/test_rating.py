@@ -0,0 +1,136 @@
+from app import db
+from app.models import User, GameResults, UserPlacements, Counters
+from app.utils import results
+from app.utils.rating import (count_placements, check_consistency, rate_all,
+                              build_snapshot, swap_snapshot)
+from conftest import create_users, play
+
+
+def points(users):
+    return [User.query.get(user.id).points for user in users]
+
+
+def recount(users):
+    counts = count_placements()
+    return [User.rate_placements(counts[user.id]) for user in users]
+
+
+def test_finish_rates_incrementally():
+    users = create_users(4)
+    play(users, [1, 2, 3, 4])
+    play(users, [4, 3, 2, 1])
+    assert points(users) == recount(users)
+    assert UserPlacements.query.get(users[0].id).results == \
+        {1: 1, 2: 0, 3: 0, 4: 1}
+
+
+def test_missing_placements_are_seeded_from_history():
+    users = create_users(4)
+    for _ in range(2):
+        play(users, [4, 3, 2, 1])
+    # Users rated before user_placements existed
+    UserPlacements.query.delete()
+    db.session.commit()
+    play(users, [1, 2, 3, 4])
+    assert points(users) == recount(users)
+    assert UserPlacements.query.get(users[0].id).results == \
+        {1: 1, 2: 0, 3: 0, 4: 2}
+
+
+def test_seeding_keeps_records_of_concurrent_transactions():
+    users = create_users(4)
+    play(users, [4, 3, 2, 1])
+    before = UserPlacements.query.get(users[0].id).results
+    # Seeded by another transaction after this one found them missing
+    UserPlacements.seed([user.id for user in users])
+    db.session.commit()
+    assert UserPlacements.query.get(users[0].id).results == before
+
+
+def test_consistency_check_repairs_points():
+    users = create_users(4)
+    play(users, [1, 2, 3, 4])
+    user = User.query.get(users[3].id)
+    user.points = 100
+    db.session.commit()
+    assert check_consistency() == [users[3].id]
+    assert points(users) == recount(users)
+    assert check_consistency() == []
+
+
+def test_unbackfilled_results_are_backfilled_before_counting():
+    users = create_users(4)
+    play(users, [1, 2, 3, 4])
+    expected = points(users)
+    # A database upgraded without 'flask backfill-results'
+    GameResults.query.delete()
+    Counters.query.filter_by(name=results.BACKFILLED).delete()
+    db.session.commit()
+    results.backfilled = False
+    # Finishing a game leaves rating to the nightly maintenance
+    play(users, [4, 3, 2, 1])
+    assert points(users) == expected
+    check_consistency()
+    assert GameResults.query.count() == 8
+    assert points(users) == recount(users)
+    assert UserPlacements.query.get(users[0].id).results == \
+        {1: 1, 2: 0, 3: 0, 4: 1}
+
+
+def test_unfinished_results_of_upgraded_databases_are_backfilled():
+    users = create_users(4)
+    game = play(users, [1, 2, 3, 4], finish=False)
+    # Upgraded before any game was finished
+    GameResults.query.delete()
+    Counters.query.filter_by(name=results.BACKFILLED).delete()
+    db.session.commit()
+    results.backfilled = False
+    assert not results.is_backfilled(game.id)
+    results.ensure_backfilled()
+    assert GameResults.query.filter_by(game_id=game.id).count() == 4
+    game.finish()
+    assert points(users) == recount(users)
+
+
+def test_rate_all_matches_calculate_points():
+    users = create_users(5)
+    play(users[:4], [1, 2, 3, 4])
+    play(users[1:], [4, 1, 2, 3])
+    play(users[:4], [2, 2, 1, 4], finish=False)
+    expected = [User.query.get(user.id).calculate_points() for user in users]
+    User.query.update({User.points: None})
+    db.session.commit()
+    assert rate_all() == 5
+    assert points(users) == expected
+
+
+def test_swap_skips_users_rated_since_the_snapshot():
+    users = create_users(4)
+    play(users, [1, 2, 3, 4])
+    User.query.update({User.points: 100})
+    db.session.commit()
+    assert len(build_snapshot()) == 4
+    # Finished while the snapshot was built
+    late = [User(username=f"late{index}", password="") for index in range(2)]
+    db.session.add_all(late)
+    db.session.commit()
+    play(users[:2] + late, [4, 3, 2, 1])
+    assert swap_snapshot() == 2
+    assert points(users) == recount(users)
+
+
+def test_placements_outside_of_1_to_4_are_skipped(caplog):
+    users = create_users(4)
+    play(users, [1, 2, 3, 4])
+    before = points(users)
+    play(users, [1, 5, 3, 0])
+    assert points(users)[1::2] == before[1::2]
+    assert UserPlacements.query.get(users[1].id).results == \
+        {1: 0, 2: 1, 3: 0, 4: 0}
+    assert count_placements()[users[1].id] == {1: 0, 2: 1, 3: 0, 4: 0}
+    assert "Skipped placement 5 of user" in caplog.text
+    assert check_consistency() == []
+    UserPlacements.query.delete()
+    db.session.commit()
+    play(users, [1, 2, 3, 4])
+    assert points(users) == recount(users)
@@ -0,0 +1,43 @@
+import pytest
+from app.models import User, AltRatings
+from app.utils.rating import count_placements
+from app.utils.replay import replay, write_alt_ratings
+from conftest import create_users, play
+
+np = pytest.importorskip("numpy")
+
+
+def test_current_model_matches_points():
+    users = create_users(5)
+    play(users[:4], [1, 2, 3, 4])
+    play(users[1:], [1, 1, 3, 4])
+    history, ratings = replay("current")
+    counts = count_placements()
+    assert dict(zip(history.user_ids.tolist(), ratings.tolist())) == {
+        user.id: User.rate_placements(counts[user.id]) for user in users}
+
+
+def test_elo_is_zero_sum():
+    users = create_users(4)
+    play(users, [1, 2, 3, 4])
+    play(users, [2, 1, 4, 3])
+    history, ratings = replay("elo", k=24)
+    assert ratings.sum() == pytest.approx(4 * 1500)
+    assert ratings[history.user_ids.tolist().index(users[0].id)] > 1500
+    assert ratings[history.user_ids.tolist().index(users[3].id)] < 1500
+
+
+def test_write_alt_ratings():
+    users = create_users(4)
+    play(users, [1, 2, 3, 4])
+    history, ratings = replay("decay")
+    assert write_alt_ratings("decay", history, ratings) == 4
+    assert write_alt_ratings("decay", history, ratings) == 4
+    assert {(rating.user_id, rating.games) for rating in
+            AltRatings.query.filter_by(model="decay")} == {
+        (user.id, 1) for user in users}
+
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        replay("unknown")
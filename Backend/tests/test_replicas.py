@@ -0,0 +1,116 @@
+import base64
+import itertools
+import pytest
+import sqlite3
+from app import app, db
+from app.models import Counters, User
+from app.utils import httpcache
+from app.utils.leaderboard import leaderboard
+from app.utils.replicas import (listen_replica, remember_write,
+                                reads_from_replica)
+from conftest import create_users
+from flask import g
+from sqlalchemy.exc import OperationalError
+
+
+def basic(username, password):
+    credentials = base64.b64encode(f"{username}:{password}".encode())
+    return {"Authorization": "Basic " + credentials.decode()}
+
+
+def alternate(monkeypatch, name, values):
+    """Counters.<name> alternates between values, like a lagging replica"""
+    values = itertools.cycle(values)
+    monkeypatch.setattr(Counters, name,
+                        staticmethod(lambda *args: next(values)))
+
+
+def test_leaderboard_ignores_older_versions(monkeypatch):
+    create_users(3, points=[1, 2, 3])
+    builds = []
+    build = leaderboard.build
+    monkeypatch.setattr(leaderboard, "build",
+                        lambda version: builds.append(version) or
+                        build(version))
+    alternate(monkeypatch, "get", [5, 4])
+    for _ in range(20):
+        entries, _ = leaderboard.page()
+        assert [entry["id"] for entry in entries] == [3, 2, 1]
+    assert builds == [5]
+
+
+def test_responses_ignore_older_versions(client, monkeypatch):
+    create_users(3, points=[1, 2, 3])
+    alternate(monkeypatch, "get_many", [{"leaderboard": 5},
+                                        {"leaderboard": 4}])
+    misses = httpcache.stats["misses"]
+    etags = set()
+    for _ in range(20):
+        response = client.get("/api/user/leaderboard")
+        assert len(response.get_json()) == 3
+        etags.add(response.headers["ETag"])
+    assert httpcache.stats["misses"] == misses + 1
+    assert len(etags) == 1
+
+
+@pytest.fixture
+def replica(monkeypatch, tmp_path):
+    """Returns a function copying the primary into a configured replica"""
+    path = str(tmp_path / "replica.db")
+    uri = "sqlite:///" + path
+    monkeypatch.setitem(app.config, "DATABASE_REPLICAS", [uri])
+    monkeypatch.setitem(app.config, "SQLALCHEMY_BINDS", {"replica0": uri})
+
+    def replicate():
+        source, target = sqlite3.connect(db.engine.url.database), \
+            sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+        listen_replica(db.get_engine(app, bind="replica0"))
+    yield replicate
+    db.get_engine(app, bind="replica0").dispose()
+    db.get_app().extensions["sqlalchemy"].connectors.pop("replica0", None)
+
+
+def usernames(client):
+    response = client.get("/api/user/list?limit=0")
+    return sorted(user["username"] for user in response.get_json())
+
+
+def test_reads_and_writes_are_routed(client, replica):
+    create_users(2)
+    replica()
+    db.session.add(User(username="late", password=""))
+    db.session.commit()
+    assert usernames(client) == ["user0", "user1"]
+    response = client.post("/api/user/sign-up", json={
+        "username": "alice", "password": "secret"})
+    assert response.status_code == 201
+    assert User.query.filter_by(username="alice").count() == 1
+    # Within REPLICA_STICKY_SECONDS of the write
+    assert usernames(client) == ["alice", "late", "user0", "user1"]
+
+
+def test_replica_connections_are_read_only(replica):
+    create_users(1)
+    replica()
+    engine = db.get_engine(app, bind="replica0")
+    with pytest.raises(OperationalError):
+        engine.execute("DELETE FROM user")
+
+
+def test_stickiness_follows_the_user_across_credentials(replica):
+    user = create_users(1)[0]
+    _, token = user.generate_auth_token()
+    with app.test_request_context("/", method="POST", headers=basic(
+            "user0", "secret")):
+        g.user = user
+        remember_write()
+    with app.test_request_context("/", headers=basic(token.decode(), "")):
+        # Before the token is verified
+        assert reads_from_replica() is None
+        g.user = user
+        assert reads_from_replica() is False
+    with app.test_request_context("/"):
+        assert reads_from_replica() is True
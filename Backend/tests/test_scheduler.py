@@ -0,0 +1,58 @@
+import json
+import pytest
+from app import app, cron
+from app.models import ScheduledJobs
+from app.utils import scheduler
+from conftest import create_users
+from datetime import datetime, timedelta
+
+
+def test_blocked_writes_are_rejected(client):
+    create_users(1)
+    ScheduledJobs.block_writes("maintenance")
+    assert client.post("/api/tournaments/create").status_code == 503
+    assert client.get("/api/user/list").status_code == 200
+    ScheduledJobs.block_writes("maintenance", False)
+    assert client.post("/api/tournaments/create").status_code != 503
+
+
+def test_blocks_of_crashed_workers_expire(client):
+    # Left over by a worker which crashed during maintenance
+    ScheduledJobs.update("maintenance", blocking_since=datetime.utcnow()
+                         - timedelta(hours=1))
+    assert not ScheduledJobs.writes_blocked(600)
+    assert client.post("/api/tournaments/create").status_code != 503
+
+
+def test_only_one_process_holds_the_file_lock(tmp_path):
+    path = str(tmp_path / "scheduler.lock")
+    leader = scheduler.try_file_lock(path)
+    assert leader is not None
+    assert scheduler.try_file_lock(path) is None
+    leader.close()
+    assert scheduler.try_file_lock(path) is not None
+
+
+def test_run_maintenance_records_the_run():
+    create_users(2, points=[1, 2])
+    scheduler.run_maintenance()
+    job = ScheduledJobs.query.get("maintenance")
+    assert job.last_status == "ok" and not job.running
+    assert job.owner == scheduler.owner
+    assert job.blocking_since is None
+    assert set(json.loads(job.timings)) == {"snapshot", "swap", "top_100",
+                                            "vacuum"}
+
+
+@pytest.mark.parametrize("cli", [True, False])
+def test_cli_commands_dont_start_the_scheduler(monkeypatch, cli):
+    started = []
+    monkeypatch.setitem(app.config, "SCHEDULER", "leader")
+    monkeypatch.setattr(cron, "start", lambda: started.append(True))
+    monkeypatch.setattr(cron, "add_job", lambda *args, **kwargs: None)
+    if cli:
+        monkeypatch.setenv("FLASK_RUN_FROM_CLI", "true")
+    else:
+        monkeypatch.delenv("FLASK_RUN_FROM_CLI", raising=False)
+    scheduler.start_scheduler()
+    assert started == ([] if cli else [True])
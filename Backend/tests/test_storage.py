@@ -0,0 +1,62 @@
+from app import app, db
+from app.utils.storage import (set_statement_timeout, vacuum,
+                               vacuum_postgresql)
+
+
+class FakeConnection(object):
+    """DBAPI connection recording the statements sent to it"""
+
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+    def close(self):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakeRecord(object):
+
+    def __init__(self):
+        self.info = {}
+
+
+def test_statement_timeout_is_scoped_to_requests():
+    connection, record = FakeConnection(), FakeRecord()
+    timeout = app.config["DB_STATEMENT_TIMEOUT"]
+    # Maintenance and CLI commands
+    set_statement_timeout(connection, record, None, "postgresql")
+    assert connection.statements == ["SET statement_timeout = 0"]
+    with app.test_request_context("/api/user/list"):
+        set_statement_timeout(connection, record, None, "postgresql")
+        set_statement_timeout(connection, record, None, "postgresql")
+    assert connection.statements[1:] == [
+        f"SET statement_timeout = {timeout}"]
+    set_statement_timeout(connection, record, None, "postgresql")
+    assert connection.statements[-1] == "SET statement_timeout = 0"
+    assert connection.commits == 3
+
+
+def test_vacuum_sqlite():
+    report = vacuum()
+    assert report["database"] == "sqlite"
+    assert report["auto_vacuum"] == "incremental"
+    assert report["free_pages"] >= 0
+
+
+def test_vacuum_postgresql_has_no_timeout():
+    connection = FakeConnection()
+    report = {}
+    vacuum_postgresql(connection, report)
+    assert connection.statements[0] == "SET statement_timeout = 0"
+    assert connection.statements[1:] == [
+        f'VACUUM (ANALYZE) "{table}"' for table in sorted(db.metadata.tables)]
+    assert sorted(report["tables"]) == sorted(db.metadata.tables)
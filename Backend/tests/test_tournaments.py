@@ -0,0 +1,86 @@
+import pytest
+from datetime import date, timedelta
+from app import db
+from app.models import Tournaments, TournamentPlayers
+from app.utils.end_dates import backfill_end_dates
+from conftest import create_users
+
+
+def create_tournaments(count, players):
+    users = create_users(players)
+    return Tournaments.create_many([dict(
+        name=f"tournament{index}", date=date.today() - timedelta(days=1),
+        duration=3, participants=[user.id for user in users[:index + 1]])
+        for index in range(count)], users[0].id)
+
+
+def test_list_query_count_is_constant(client, count_queries):
+    create_tournaments(10, 10)
+    counts = []
+    for limit in (2, 8):
+        del count_queries[:]
+        response = client.get(f"/api/tournaments/list?limit={limit}")
+        assert response.status_code == 200
+        assert len(response.get_json()) == limit
+        counts.append(len(count_queries))
+    assert counts[0] == counts[1]
+
+
+def test_ongoing_query_count_is_constant(client, count_queries):
+    create_tournaments(10, 10)
+    counts = []
+    for limit in (2, 8):
+        del count_queries[:]
+        response = client.get(f"/api/tournaments/ongoing?limit={limit}")
+        assert response.status_code == 200
+        tournaments = response.get_json()
+        assert len(tournaments) == limit
+        assert all(tournament["active"] for tournament in tournaments)
+        counts.append(len(count_queries))
+    assert counts[0] == counts[1]
+
+
+def test_list_details(client):
+    create_tournaments(3, 3)
+    tournaments = client.get("/api/tournaments/list").get_json()
+    assert [tournament["participants"] for tournament in tournaments] == \
+        [1, 2, 3]
+    assert {tournament["maintainer_username"]
+            for tournament in tournaments} == {"user0"}
+
+
+def test_backfill_end_dates(client):
+    tournaments = create_tournaments(3, 3)
+    expected = {tournament.id: tournament.end_date
+                for tournament in tournaments}
+    db.session.execute(Tournaments.__table__.update().values(end_date=None))
+    db.session.commit()
+    assert client.get("/api/tournaments/ongoing").get_json() == []
+    assert backfill_end_dates() == 3
+    assert {tournament.id: tournament.end_date
+            for tournament in Tournaments.query} == expected
+    assert len(client.get("/api/tournaments/ongoing").get_json()) == 3
+
+
+def test_bulk_create_in_constant_statements(count_queries):
+    users = create_users(10)
+    ids = [user.id for user in users]
+    Tournaments.create_many([dict(name="warmup", date=date.today(),
+                                  participants=ids)], ids[0])
+    counts = []
+    for count in (2, 20):
+        del count_queries[:]
+        Tournaments.create_many([dict(
+            name=f"t{index}", date=date.today(), duration=2,
+            participants=ids) for index in range(count)], ids[0])
+        counts.append(len(count_queries))
+    assert counts[0] == counts[1]
+    assert TournamentPlayers.query.count() == 10 * 23
+
+
+def test_bulk_create_rejects_unknown_participants():
+    users = create_users(1)
+    with pytest.raises(ValueError):
+        Tournaments.create_many([dict(name="t", date=date.today(),
+                                      participants=[users[0].id, 99])],
+                                users[0].id)
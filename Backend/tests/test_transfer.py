@@ -0,0 +1,112 @@
+import base64
+import io
+import pytest
+from app import db
+from app.models import Tournaments, TournamentPlayers, Games, User, Role
+from app.utils import transfer
+from app.utils.rating import count_placements
+from app.utils.transfer import (read_records, import_records, export_all,
+                                export_table, PartialImport)
+from conftest import create_users, play
+from datetime import date, timedelta
+
+
+def import_lines(*lines, format="ndjson", name=None):
+    return import_records(read_records(io.StringIO("\n".join(lines)),
+                                       format, name))
+
+
+def test_import_without_duration_uses_its_default():
+    create_users(1)
+    today = date.today().isoformat()
+    import_lines('{"table":"tournaments","id":1,"name":"a","date":"'
+                 + today + '","maintainer_id":1}')
+    tournament = Tournaments.query.get(1)
+    assert tournament.duration == 1
+    assert tournament.end_date == date.today() + timedelta(days=1)
+
+
+def test_import_rows_with_different_keys():
+    counts = import_lines(
+        '{"table":"games","id":1,"date":"2020-01-01","state":0}',
+        '{"table":"games","id":2,"date":"2020-01-02"}',
+        '{"table":"games","id":3,"state":2,"result":[]}')
+    assert counts == {"games": 3}
+    assert [(game.id, game.state) for game in Games.query.order_by(
+        Games.id)] == [(1, 0), (2, 1), (3, 2)]
+
+
+def test_export_roundtrip():
+    users = create_users(2)
+    Tournaments.create_many([dict(
+        name="t", date=date(2020, 1, 1), duration=2,
+        participants=[user.id for user in users])], users[0].id)
+    tournaments = "".join(export_table("tournaments", "csv"))
+    everything = "".join(export_all())
+    TournamentPlayers.query.delete()
+    Tournaments.query.delete()
+    db.session.commit()
+    assert import_lines(*everything.splitlines()) == {
+        "tournaments": 1, "tournament_players": 2}
+    assert "".join(export_table("tournaments", "csv")) == tournaments
+
+
+def test_csv_roundtrip_keeps_nulls_and_empty_strings():
+    users = create_users(1)
+    Tournaments.create_many([
+        dict(name="a", date=date(2020, 1, 1), description=None,
+             participants=[]),
+        dict(name="", date=date(2020, 1, 1), description="",
+             participants=[]),
+        dict(name="\\N", date=date(2020, 1, 1), description="\\\\x",
+             participants=[])],
+        users[0].id)
+    table = Tournaments.__table__
+    original = db.session.execute(table.select().order_by(table.c.id)
+                                  ).fetchall()
+    export = "".join(export_table("tournaments", "csv"))
+    Tournaments.query.delete()
+    db.session.commit()
+    import_lines(*export.splitlines(), format="csv", name="tournaments")
+    assert db.session.execute(table.select().order_by(table.c.id)
+                              ).fetchall() == original
+
+
+def test_partial_imports_report_committed_rows():
+    today = date.today().isoformat()
+    create_users(1)
+    lines = ['{"table":"tournaments","id":1,"name":"a","date":"' + today +
+             '","maintainer_id":1}', '{"table":"unknown"}']
+    with pytest.raises(PartialImport) as error:
+        import_records(read_records(lines), chunk_size=1)
+    assert error.value.counts == {"tournaments": 1}
+    assert Tournaments.query.count() == 1
+
+
+def test_imports_repair_ratings_outside_of_the_request(client, monkeypatch):
+    users = create_users(4)
+    ids = [user.id for user in users]
+    game = play(users, [1, 2, 3, 4])
+    export = "".join(export_table("games", tagged=True)) + \
+        "".join(export_table("user_games", tagged=True))
+    user = User.query.get(users[0].id)
+    user.hash_password("secret")
+    role = Role(name="admin")
+    user.roles.append(role)
+    db.session.delete(game)
+    User.query.update({User.points: 0})
+    db.session.commit()
+    threads = []
+    repair = transfer.repair_ratings_later
+    monkeypatch.setattr(transfer, "repair_ratings_later",
+                        lambda: threads.append(repair()))
+    credentials = base64.b64encode(b"user0:secret").decode()
+    response = client.post("/api/admin/import/all", data=export, headers={
+        "Authorization": "Basic " + credentials})
+    assert response.status_code == 201
+    assert response.get_json() == {"imported": {"games": 1, "user_games": 4},
+                                   "repairing_ratings": True}
+    threads[0].join()
+    db.session.remove()
+    assert [User.query.get(id).points for id in ids] == \
+        [User.rate_placements(count_placements()[id]) for id in ids]